@@ -1,4 +1,5 @@
 import io
+import logging
 from datetime import datetime
 
 from django.shortcuts import render
@@ -19,6 +20,9 @@ from exams.models import Exam as Quiz
 from answer_sheets.models import AnswerSheetTemplate
 from django.http import HttpResponse
 import openpyxl
+from grading.regrade import regrade_exam
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -72,6 +76,13 @@ class GenerateAnswerKeyView(APIView):
                 answer_key.updated_at = datetime.now()
                 answer_key.save()
                 status_code = status.HTTP_200_OK
+
+                # Chấm lại các phiếu đã quét từ mức tô đã lưu, không cần ảnh
+                try:
+                    regraded = regrade_exam(quiz)
+                except Exception as e:
+                    logger.error(f"Error regrading quiz {quiz_id}: {str(e)}")
+                    regraded = None
             else:
                 # Create new
                 answer_key = AnswerKey(
@@ -87,10 +98,10 @@ class GenerateAnswerKeyView(APIView):
                 answer_key.save()
                 status_code = status.HTTP_201_CREATED
 
-            return Response(
-                AnswerKeySerializer(answer_key).data,
-                status=status_code
-            )
+            data = AnswerKeySerializer(answer_key).data
+            if status_code == status.HTTP_200_OK:
+                data['regraded'] = regraded
+            return Response(data, status=status_code)
 
         except Quiz.DoesNotExist:
             return Response(
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from answer_sheets.models import AnswerSheetArtifact, AnswerSheetTemplate
+from answer_sheets.utils import PREVIEW_SIZES, RENDER_VERSION, rasterize_previews, render_answer_sheet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LABELS = ["Name", "Quiz", "Class", "Score"]
+
+
+def layout_params(template, widths=None):
+    """Everything that changes the rendered sheet; two templates with equal params share files"""
+    labels = list(getattr(template, 'labels', None) or DEFAULT_LABELS)
+    if widths is None:
+        widths = getattr(template, 'widths', None) or ["Medium"] * len(labels)
+    return {
+        'render_version': RENDER_VERSION,
+        'num_questions': int(template.num_questions),
+        'num_options': int(template.num_options),
+        'student_id_digits': int(template.student_id_digits),
+        'exam_id_digits': int(template.exam_id_digits),
+        'class_id_digits': int(template.class_id_digits),
+        'labels': labels,
+        'widths': list(widths)
+    }
+
+
+def layout_key(params):
+    """sha256 of the canonical JSON of the layout params"""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def artifact_paths(key):
+    artifact_dir = settings.ANSWER_SHEET_CONFIG['ARTIFACT_DIR']
+    return (
+        os.path.join(artifact_dir, f'{key}.pdf'),
+        os.path.join(artifact_dir, f'{key}.json'),
+        os.path.join(artifact_dir, f'{key}.png')
+    )
+
+
+def preview_path(png_path, size):
+    """Path of one of PREVIEW_SIZES, stored next to the full-size PNG"""
+    if size == 'full':
+        return png_path
+    return f'{os.path.splitext(png_path)[0]}_{size}.{PREVIEW_SIZES[size][1]}'
+
+
+def _store_files(key):
+    pdf_path, json_path, png_path = artifact_paths(key)
+    return [pdf_path, json_path] + [preview_path(png_path, size) for size in PREVIEW_SIZES]
+
+
+def _files_size(key):
+    return sum(os.path.getsize(path) for path in _store_files(key) if os.path.exists(path))
+
+
+def _write_atomic(path, data):
+    # Ghi file tạm rồi rename để request khác không đọc phải file ghi dở
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _render_to_store(template, params, key):
+    paths = artifact_paths(key)
+    pdf_bytes, png_bytes, layout = render_answer_sheet(template, widths=params['widths'])
+    os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+    _write_atomic(paths[0], pdf_bytes)
+    _write_atomic(paths[1], json.dumps(layout, indent=2).encode('utf-8'))
+    _write_atomic(paths[2], png_bytes)
+    small = rasterize_previews(pdf_bytes, [size for size in PREVIEW_SIZES if size != 'full'])
+    for size, data in small.items():
+        _write_atomic(preview_path(paths[2], size), data)
+    AnswerSheetArtifact.objects(key=key).update_one(set__size_bytes=_files_size(key))
+    logger.info(f"Rendered answer sheet artifacts {key}")
+
+
+def acquire_artifacts(template, widths=None):
+    """
+    Shared (pdf, json, png) paths for a template's layout, taking one reference.
+
+    Files are rendered only when the layout is not in the store yet (or was evicted).
+    Every call must be balanced by release_artifacts(key) when the template goes away.
+    Returns (key, pdf_path, json_path, png_path).
+    """
+    params = layout_params(template, widths)
+    key = layout_key(params)
+    paths = artifact_paths(key)
+
+    # Tăng tham chiếu trước rồi mới kiểm tra file, để release đồng thời không xoá mất file
+    artifact = AnswerSheetArtifact.objects(key=key).modify(
+        upsert=True,
+        new=True,
+        inc__refcount=1,
+        set__last_used_at=datetime.now(),
+        set_on_insert__params=params,
+        set_on_insert__file_pdf=paths[0],
+        set_on_insert__file_json=paths[1],
+        set_on_insert__file_png=paths[2],
+        set_on_insert__created_at=datetime.now()
+    )
+    try:
+        if not all(os.path.exists(p) for p in paths):
+            _render_to_store(template, params, key)
+        else:
+            logger.info(f"Reusing answer sheet artifacts {key} ({artifact.refcount} templates)")
+    except Exception:
+        release_artifacts(key)
+        raise
+    return (key,) + paths
+
+
+def release_artifacts(key):
+    """Drop one reference; the files stay cached until prune_artifacts evicts them"""
+    AnswerSheetArtifact.objects(key=key).update_one(dec__refcount=1, set__last_used_at=datetime.now())
+
+
+def restore_artifacts(template):
+    """Re-render the shared files of a template if they went missing from disk"""
+    key = template.artifact_key
+    if not key or all(os.path.exists(path) for path in artifact_paths(key)):
+        return
+    params = layout_params(template)
+    # Key cũ (RENDER_VERSION khác) thì không ghi bản vẽ mới dưới key đó
+    if layout_key(params) == key:
+        logger.warning(f"Answer sheet artifacts {key} missing on disk, rendering again")
+        _render_to_store(template, params, key)
+
+
+def _remove_files(key):
+    for path in _store_files(key):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"Error removing artifact file {path}: {str(e)}")
+
+
+def prune_artifacts(budget_bytes=None, max_idle=None, dry_run=False):
+    """
+    Evict layouts no template references, least recently used first, until the store
+    fits in budget_bytes; layouts unused for longer than max_idle go regardless.
+
+    Works from the AnswerSheetArtifact index only (no directory scan). Before evicting,
+    the refcount is checked against the templates that actually point at the key and
+    repaired if it drifted. Returns {'evicted', 'freed_bytes', 'total_bytes'}.
+    """
+    config = settings.ANSWER_SHEET_CONFIG
+    if budget_bytes is None:
+        budget_bytes = config['ARTIFACT_DISK_BUDGET_MB'] * 1024 * 1024
+    if max_idle is None:
+        max_idle = timedelta(days=config['ARTIFACT_MAX_IDLE_DAYS'])
+    idle_before = datetime.now() - max_idle
+
+    # Bản ghi cũ chưa có size_bytes: tính một lần từ file
+    for artifact in AnswerSheetArtifact.objects(size_bytes__in=[0, None]).only('key'):
+        AnswerSheetArtifact.objects(key=artifact.key).update_one(set__size_bytes=_files_size(artifact.key))
+
+    total = AnswerSheetArtifact.objects.sum('size_bytes')
+    evicted = []
+    freed = 0
+    candidates = AnswerSheetArtifact.objects(refcount__lte=0).order_by('last_used_at').only(
+        'key', 'size_bytes', 'last_used_at')
+    for artifact in candidates:
+        if total - freed <= budget_bytes and artifact.last_used_at >= idle_before:
+            break
+        references = AnswerSheetTemplate.objects(artifact_key=artifact.key).count()
+        if references:
+            AnswerSheetArtifact.objects(key=artifact.key).update_one(set__refcount=references)
+            logger.warning(f"Repaired refcount of answer sheet artifacts {artifact.key} to {references}")
+            continue
+        if dry_run:
+            evicted.append(artifact.key)
+            freed += artifact.size_bytes or 0
+            continue
+        # Chỉ xoá khi không có acquire nào chen vào giữa
+        if AnswerSheetArtifact.objects(key=artifact.key, refcount__lte=0).delete():
+            _remove_files(artifact.key)
+            evicted.append(artifact.key)
+            freed += artifact.size_bytes or 0
+
+    if evicted:
+        logger.info(f"{'Would evict' if dry_run else 'Evicted'} {len(evicted)} answer sheet artifacts, "
+                    f"{freed} of {total} bytes")
+    return {'evicted': evicted, 'freed_bytes': freed, 'total_bytes': total - (0 if dry_run else freed)}
+
+
+def ensure_preview(png_path, pdf_path, size):
+    """
+    Path of a preview size, rasterized from the stored PDF the first time it is asked for
+    (files stored before the size existed, or templates from before the artifact store).
+    """
+    path = preview_path(png_path, size)
+    if not os.path.exists(path) and pdf_path and os.path.exists(pdf_path):
+        with open(pdf_path, 'rb') as f:
+            data = rasterize_previews(f.read(), [size])[size]
+        _write_atomic(path, data)
+    return path
+
+
+def cached_preview(template, widths=None, size='full'):
+    """Preview bytes of a layout that is already in the store, None otherwise"""
+    key = layout_key(layout_params(template, widths))
+    pdf_path, _, png_path = artifact_paths(key)
+    # Lần dùng gần nhất quyết định thứ tự bị prune_artifacts dọn
+    if not AnswerSheetArtifact.objects(key=key).modify(set__last_used_at=datetime.now()) \
+            or not os.path.exists(png_path):
+        return None
+    with open(ensure_preview(png_path, pdf_path, size), 'rb') as f:
+        return f.read()
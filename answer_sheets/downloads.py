@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=1024)
+def _content_etag(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return quote_etag(digest.hexdigest()[:32])
+
+
+def file_etag(path, stat=None):
+    """
+    Strong ETag from the file content.
+
+    Hashed once per (path, mtime, size): shared artifacts are written atomically under
+    a new mtime, so a re-rendered file always gets a new tag.
+    """
+    stat = stat or os.stat(path)
+    return _content_etag(path, stat.st_mtime_ns, stat.st_size)
+
+
+def etag_matches(header, etag):
+    """If-None-Match comparison (weak: W/ prefixes are ignored)"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    strip = lambda tag: tag[2:] if tag.startswith('W/') else tag
+    return strip(etag) in {strip(tag) for tag in parse_etags(header)}
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to serve the whole file,
+    or False when the range cannot be satisfied.
+
+    Multiple ranges are answered with the whole file, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N: N byte cuối
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def cached_file_response(request, path, content_type, filename=None, as_attachment=False,
+                         max_age=None):
+    """
+    FileResponse with a content ETag, Cache-Control, 304 on If-None-Match and single
+    byte ranges (206 / 416). The caller checks that path exists.
+    """
+    if max_age is None:
+        max_age = settings.ANSWER_SHEET_CONFIG.get('DOWNLOAD_MAX_AGE', 300)
+    stat = os.stat(path)
+    etag = file_etag(path, stat)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'private, max-age={max_age}',
+        'Accept-Ranges': 'bytes',
+    }
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    # Chỉ trả một phần khi client còn giữ đúng phiên bản file
+    if request.method == 'GET' and (not if_range or if_range.strip() == etag):
+        byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(path, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+        if filename:
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    else:
+        response = FileResponse(open(path, 'rb'), as_attachment=as_attachment,
+                                filename=filename or '', content_type=content_type)
+    for name, value in headers.items():
+        response[name] = value
+    return response
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from answer_sheets.artifacts import prune_artifacts
+
+
+class Command(BaseCommand):
+    help = 'Evict answer sheet artifacts no template uses any more, least recently used first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, pruning every interval')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be evicted')
+        parser.add_argument('--budget-mb', type=int, help='Disk budget of the artifact store')
+        parser.add_argument('--max-idle-days', type=int, help='Evict unreferenced layouts unused for this long')
+
+    def handle(self, *args, **options):
+        budget_bytes = options['budget_mb'] * 1024 * 1024 if options['budget_mb'] is not None else None
+        max_idle = timedelta(days=options['max_idle_days']) if options['max_idle_days'] is not None else None
+        interval = settings.ANSWER_SHEET_CONFIG['ARTIFACT_PRUNE_INTERVAL_SECONDS']
+
+        while True:
+            result = prune_artifacts(budget_bytes, max_idle, dry_run=options['dry_run'])
+            verb = 'Would evict' if options['dry_run'] else 'Evicted'
+            self.stdout.write(f"{verb} {len(result['evicted'])} artifacts, "
+                              f"{result['freed_bytes']} bytes; store now {result['total_bytes']} bytes")
+            if not options['loop']:
+                break
+            time.sleep(interval)
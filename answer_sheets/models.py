@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, ListField, DictField, IntField, ValidationError, ObjectIdField
+from mongoengine import Document, StringField, ListField, DictField, IntField, ValidationError, ObjectIdField, DateTimeField
 from users.models import User
 import re
 from datetime import datetime
@@ -22,10 +22,11 @@ class AnswerSheetTemplate(Document):
     created_at = StringField(required=True)
     updated_at = StringField(required=True)
     backup_dir = StringField()
+    artifact_key = StringField()  # hash layout, xem answer_sheets.artifacts
 
     meta = {
         'collection': 'answer_sheet_templates',
-        'indexes': ['name', 'teacher_id'],
+        'indexes': ['name', 'teacher_id', 'artifact_key', ('teacher_id', 'id')],
         'ordering': ['-created_at']
     }
 
@@ -68,6 +69,15 @@ class AnswerSheetTemplate(Document):
         return super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
+        if self.artifact_key:
+            # File dùng chung giữa các template cùng layout: chỉ giảm số tham chiếu
+            try:
+                from answer_sheets.artifacts import release_artifacts
+                release_artifacts(self.artifact_key)
+            except Exception as e:
+                print(f"Error releasing artifacts {self.artifact_key}: {str(e)}")
+            super().delete(*args, **kwargs)
+            return
         try:
             # Delete associated files
             if self.file_pdf and os.path.exists(self.file_pdf):
@@ -79,15 +89,20 @@ class AnswerSheetTemplate(Document):
             # Xóa preview_image nếu có
             if self.preview_image and os.path.exists(self.preview_image):
                 os.remove(self.preview_image)
-            # Luôn xóa file preview theo id nếu tồn tại
+            # Luôn xóa file preview theo id (mọi kích thước) nếu tồn tại
             try:
                 from django.conf import settings
-                preview_path = os.path.join(
+                from answer_sheets.artifacts import preview_path
+                from answer_sheets.utils import PREVIEW_SIZES
+                png_path = os.path.join(
                     settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'],
                     f'{self.id}_preview.png'
                 )
-                if os.path.exists(preview_path):
-                    os.remove(preview_path)
+                for base in {png_path, self.preview_image or png_path}:
+                    for size in PREVIEW_SIZES:
+                        path = preview_path(base, size)
+                        if os.path.exists(path):
+                            os.remove(path)
             except Exception as e:
                 print(f"Error cleaning up preview file by id: {str(e)}")
             if self.backup_dir and os.path.exists(self.backup_dir):
@@ -96,3 +111,27 @@ class AnswerSheetTemplate(Document):
         except Exception as e:
             print(f"Error cleaning up files: {str(e)}")
         super().delete(*args, **kwargs)
+
+
+class AnswerSheetArtifact(Document):
+    """
+    PDF/JSON/PNG of one sheet layout, shared by every template with the same layout parameters.
+
+    Also the index the retention job works from: files are kept after the last template
+    releases them, and answer_sheets.artifacts.prune_artifacts evicts unreferenced layouts
+    by last use once size_bytes of the whole store goes over the disk budget.
+    """
+    key = StringField(required=True, unique=True)
+    params = DictField()
+    file_pdf = StringField()
+    file_json = StringField()
+    file_png = StringField()
+    refcount = IntField(default=0)
+    size_bytes = IntField(default=0)  # tổng dung lượng các file của layout
+    created_at = DateTimeField(default=datetime.now)
+    last_used_at = DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'answer_sheet_artifacts',
+        'indexes': [('refcount', 'last_used_at')]
+    }
@@ -0,0 +1,150 @@
+import io
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+from reportlab.graphics.barcode import qrencoder
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from answer_sheets.utils import SHEET_FORM_NAME, draw_answer_sheet
+from grading.sheet_qr import encode_sheet_qr
+
+QR_SIZE = 80          # cạnh mã QR (pt)
+QR_MIN_SIZE = 48      # nhỏ hơn thì không in QR
+QR_PADDING = 6
+FILL_RATIO = 0.85     # bán kính chấm tô so với bong bóng
+NAME_FONT_SIZE = 11
+ID_SECTION_KEYS = ('student_id_section', 'quiz_id_section', 'class_id_section')
+
+
+@lru_cache(maxsize=None)
+def name_font():
+    """Font for printed student names: the Unicode TTF of NAME_FONT_PATH (tiếng Việt có dấu), registered once"""
+    font_path = settings.ANSWER_SHEET_CONFIG.get('NAME_FONT_PATH')
+    if not font_path:
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont('SheetNameFont', font_path))
+    return 'SheetNameFont'
+
+
+def define_fill_forms(c, layout):
+    """
+    One form per (ID section, column, digit) holding that bubble filled in, so pre-filling
+    an ID on a page is a few doForm references instead of redrawing circles.
+    """
+    for key in ID_SECTION_KEYS:
+        for col_idx, col in enumerate(layout[key]['columns']):
+            for bubble in col['bubbles']:
+                c.beginForm(fill_form_name(key, col_idx, bubble['value']))
+                x, y = bubble['position']
+                c.circle(x, y, bubble['radius'] * FILL_RATIO, stroke=0, fill=1)
+                c.endForm()
+
+
+def fill_form_name(key, col_idx, digit):
+    return f'{key}_{col_idx}_{digit}'
+
+
+def fill_id_bubbles(c, layout, key, value):
+    """Fill the bubble of each digit of value; False (nothing drawn) if value does not fit the section"""
+    value = str(value or '')
+    if not value.isdigit() or len(value) != len(layout[key]['columns']):
+        return False
+    for col_idx, digit in enumerate(value):
+        c.doForm(fill_form_name(key, col_idx, int(digit)))
+    return True
+
+
+def name_field(info_section):
+    """Info field the student name goes on: the one labelled Name, else the first one"""
+    fields = info_section['fields']
+    for field in fields:
+        if field['text'].strip().lower() in ('name', 'họ tên', 'ho ten'):
+            return field
+    return fields[0] if fields else None
+
+
+def draw_name(c, info_section, name):
+    field = name_field(info_section)
+    if not field or not name:
+        return
+    (x1, y), (x2, _) = field['line']['start'], field['line']['end']
+    font = name_font()
+    size = NAME_FONT_SIZE
+    # Thu nhỏ chữ nếu tên dài hơn dòng kẻ
+    while size > 6 and pdfmetrics.stringWidth(name, font, size) > x2 - x1 - 4:
+        size -= 1
+    c.setFont(font, size)
+    c.drawString(x1 + 2, y + 2, name)
+
+
+def qr_box(info_section):
+    """(x, y, size) of the free corner under the info fields, None if there is no room"""
+    x, y, width, _ = info_section['position']
+    fields = info_section['fields']
+    top = min(f['line']['start'][1] for f in fields) if fields else y + QR_SIZE + 2 * QR_PADDING
+    size = min(QR_SIZE, top - y - 2 * QR_PADDING)
+    if size < QR_MIN_SIZE:
+        return None
+    return x + width - size - QR_PADDING, y + QR_PADDING, size
+
+
+def qr_image(payload):
+    """
+    QR code for payload as a small bitmap, one pixel per module plus a 2-module quiet zone.
+
+    Uses a fixed mask pattern instead of QRCode.make(), which renders all 8 masks to pick
+    the "best" one and is ~10x slower; any mask is valid for a short printed code.
+    """
+    qr = qrencoder.QRCode(None, qrencoder.QRErrorCorrectLevel.M)
+    qr.addData(payload)
+    qr.version = qr.calculate_version()
+    qr.makeImpl(False, 0)
+    modules = np.array(qr.modules, dtype=bool)
+    pixels = np.full((modules.shape[0] + 4, modules.shape[1] + 4), 255, dtype=np.uint8)
+    pixels[2:-2, 2:-2][modules] = 0
+    return ImageReader(Image.fromarray(pixels, 'L'))
+
+
+def draw_qr(c, box, payload):
+    x, y, size = box
+    c.drawImage(qr_image(payload), x, y, size, size)
+
+
+def render_roster_pack(template, exam_id, entries, aruco_dir=None):
+    """
+    One page per roster entry, on top of a shared sheet form.
+
+    entries is an iterable of dicts with student_id, name, class_code and version. Each page
+    only adds its deltas to the form: the ID bubbles that fit (digits, right length), the
+    student name and a QR code with the same IDs. Returns (pdf_bytes, page_count).
+    """
+    aruco_dir = aruco_dir or settings.ANSWER_SHEET_CONFIG['ARUCO_MARKER_DIR']
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4, invariant=1, pageCompression=1)
+    c.beginForm(SHEET_FORM_NAME)
+    layout = draw_answer_sheet(c, template, aruco_dir)
+    c.endForm()
+    define_fill_forms(c, layout)
+    box = qr_box(layout['info_section'])
+
+    pages = 0
+    for entry in entries:
+        c.doForm(SHEET_FORM_NAME)
+        fill_id_bubbles(c, layout, 'student_id_section', entry.get('student_id'))
+        fill_id_bubbles(c, layout, 'quiz_id_section', entry.get('version'))
+        fill_id_bubbles(c, layout, 'class_id_section', entry.get('class_code'))
+        draw_name(c, layout['info_section'], entry.get('name'))
+        if box:
+            draw_qr(c, box, encode_sheet_qr(exam_id, entry.get('student_id'), entry.get('class_code'),
+                                            entry.get('version')))
+        c.showPage()
+        pages += 1
+    c.save()
+    return buffer.getvalue(), pages
@@ -1,8 +1,13 @@
+import io
 import os
 import json
 import logging
 from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
 from django.conf import settings
+from PIL import Image
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 import fitz  # PyMuPDF
@@ -17,6 +22,17 @@ PAGE_WIDTH, PAGE_HEIGHT = A4  # Kích thước trang A4
 dpi = 300
 scale_factor = dpi / 72.0
 IMAGE_HEIGHT = PAGE_HEIGHT * scale_factor
+PREVIEW_ZOOM = 2  # ảnh preview 144 DPI
+# Kích thước preview: (chiều rộng px, định dạng, tham số lưu ảnh); 'full' giữ PNG 144 DPI như trước.
+# Phiếu là nét vẽ đen trắng: WebP lossless nhỏ hơn lossy từ cỡ medium trở lên
+PREVIEW_SIZES = {
+    'thumbnail': (240, 'webp', {'quality': 80, 'method': 4}),
+    'medium': (640, 'webp', {'lossless': True, 'quality': 80, 'method': 4}),
+    'full': (None, 'png', {}),
+}
+PREVIEW_CONTENT_TYPES = {'png': 'image/png', 'webp': 'image/webp'}
+SHEET_FORM_NAME = 'answer_sheet'
+RENDER_VERSION = 1  # tăng khi thay đổi cách vẽ phiếu, để cache artifact không dùng file cũ
 
 ARUCO_SIZE = 25
 MARGIN = 40      # Khoảng cách từ mép giấy đến ArUCo markers
@@ -79,18 +95,38 @@ def get_marker_positions(regions):
     }
     return marker_positions
 
+@lru_cache(maxsize=None)
+def load_marker_bank(aruco_dir):
+    """
+    ArUco marker bitmaps of a directory, decoded once per process.
+
+    Maps marker id -> ImageReader. drawImage with the same reader stores the bitmap once
+    per PDF as an image XObject and references it from every page that uses it.
+    """
+    bank = {}
+    for name in os.listdir(aruco_dir):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() != '.png' or not stem.startswith('aruco_') or not stem[6:].isdigit():
+            continue
+        with Image.open(os.path.join(aruco_dir, name)) as img:
+            img.load()
+            bank[int(stem[6:])] = ImageReader(img.copy())
+    return MappingProxyType(bank)
+
+
 def draw_aruco_markers(c, positions, aruco_dir):
     """Draw ArUCo markers on the canvas"""
+    markers = load_marker_bank(aruco_dir)
     aruco_data = []
     for marker_id, (x, y) in positions.items():
         size = ARUCO_SIZE
         if marker_id in {1, 5, 9, 10}:
             size = 35
 
-        aruco_path = os.path.join(aruco_dir, f'aruco_{marker_id}.png')
-        if os.path.exists(aruco_path):
-            c.drawInlineImage(
-                aruco_path,
+        marker = markers.get(marker_id)
+        if marker is not None:
+            c.drawImage(
+                marker,
                 x - size / 2,
                 y - size / 2,
                 size,
@@ -268,6 +304,151 @@ def convert_bubble(bubble):
     new_bubble["radius"] = int(bubble["radius"] * scale_factor)
     return new_bubble
 
+def convert_layout(output_data):
+    """Convert layout coordinates from PDF points to template image space (in place)"""
+    # Convert ArUCo markers
+    for marker in output_data["aruco_marker"]:
+        marker["position"] = convert_point(marker["position"])
+        marker["size"] = int(marker["size"] * scale_factor)
+
+    # Convert info section
+    output_data["info_section"]["position"] = convert_box(output_data["info_section"]["position"])
+    for field in output_data["info_section"]["fields"]:
+        field["label_pos"] = convert_point(field["label_pos"])
+        field["line"]["start"] = convert_point(field["line"]["start"])
+        field["line"]["end"] = convert_point(field["line"]["end"])
+
+    # Convert ID sections
+    for key in ["student_id_section", "quiz_id_section", "class_id_section"]:
+        section = output_data[key]
+        section["position"] = convert_box(section["position"])
+        for col in section["columns"]:
+            new_bubbles = []
+            for bubble in col["bubbles"]:
+                new_bubbles.append(convert_bubble(bubble))
+            col["bubbles"] = new_bubbles
+
+    # Convert answer area
+    output_data["answer_area"]["position"] = convert_box(output_data["answer_area"]["position"])
+    for question in output_data["answer_area"]["questions"]:
+        new_bubbles = []
+        for bubble in question["bubbles"]:
+            new_bubbles.append(convert_bubble(bubble))
+        question["bubbles"] = new_bubbles
+    return output_data
+
+
+def draw_answer_sheet(c, template, aruco_dir, widths=None):
+    """Draw one answer sheet on the current canvas page; returns its layout in PDF points"""
+    # Draw borders for ID regions
+    highlight_regions = {"student_id", "quiz_id", "class_id"}
+    border_color = (0.3, 0.3, 0.3)  # màu xám trung tính
+
+    for region, (x, y, w, h) in REGIONS.items():
+        if region in highlight_regions:
+            c.setStrokeColorRGB(*border_color)
+            c.rect(x, y, w, h)
+
+    # Get marker positions and draw them
+    marker_positions = get_marker_positions(REGIONS)
+    aruco_markers = draw_aruco_markers(c, marker_positions, aruco_dir)
+
+    # Lấy labels và widths động
+    labels = getattr(template, 'labels', ["Name", "Quiz", "Class", "Score"])
+    if widths is None:
+        widths = getattr(template, 'widths', ["Medium"] * len(labels))
+    info_data = draw_info_fill(c, REGIONS["info_fill"], labels, widths)
+    student_id_data = draw_id_section(c, REGIONS["student_id"], "Student ID", template.student_id_digits)
+    quiz_id_data = draw_id_section(c, REGIONS["quiz_id"], "Quiz ID", template.exam_id_digits)
+    class_id_data = draw_id_section(c, REGIONS["class_id"], "Class ID", template.class_id_digits)
+    answer_data = draw_answer_area(c, REGIONS["answer_area"], template.num_questions, template.num_options)
+
+    return {
+        "aruco_marker": aruco_markers,
+        "info_section": info_data,
+        "student_id_section": student_id_data,
+        "quiz_id_section": quiz_id_data,
+        "class_id_section": class_id_data,
+        "answer_area": answer_data
+    }
+
+
+def preview_content_type(size):
+    return PREVIEW_CONTENT_TYPES[PREVIEW_SIZES[size][1]]
+
+
+def rasterize_previews(pdf_bytes, sizes=('full',)):
+    """
+    {size: image bytes} of the first page for each of PREVIEW_SIZES in sizes.
+
+    Every size is rasterized straight from the vector page at its own zoom rather than
+    downscaled from the full PNG, so small sizes stay sharp and cost little.
+    """
+    previews = {}
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        page = doc[0]
+        for size in sizes:
+            width, fmt, options = PREVIEW_SIZES[size]
+            if fmt == 'png':
+                pix = page.get_pixmap(matrix=fitz.Matrix(PREVIEW_ZOOM, PREVIEW_ZOOM))
+                previews[size] = pix.tobytes('png')
+                continue
+            zoom = width / page.rect.width
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY)
+            buffer = io.BytesIO()
+            Image.frombytes('L', (pix.width, pix.height), pix.samples).save(buffer, fmt.upper(), **options)
+            previews[size] = buffer.getvalue()
+    return previews
+
+
+def render_answer_sheet(template, aruco_dir=None, widths=None, preview_zoom=PREVIEW_ZOOM):
+    """
+    Render an answer sheet entirely in memory.
+
+    Returns (pdf_bytes, png_bytes, layout): the PDF, its preview rasterized once from the
+    same bytes (None when preview_zoom is None), and the JSON metadata in template image
+    coordinates. Nothing touches disk.
+    """
+    aruco_dir = aruco_dir or settings.ANSWER_SHEET_CONFIG['ARUCO_MARKER_DIR']
+
+    buffer = io.BytesIO()
+    # invariant: không nhúng ngày tạo / ID ngẫu nhiên, cùng layout cho ra cùng bytes
+    c = canvas.Canvas(buffer, pagesize=A4, invariant=1)
+    layout = draw_answer_sheet(c, template, aruco_dir, widths)
+    c.save()
+    pdf_bytes = buffer.getvalue()
+
+    # Generate preview image từ bytes, không ghi/đọc lại file PDF
+    png_bytes = None
+    if preview_zoom is not None:
+        with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+            pix = doc[0].get_pixmap(matrix=fitz.Matrix(preview_zoom, preview_zoom))
+            png_bytes = pix.tobytes('png')
+
+    return pdf_bytes, png_bytes, convert_layout(layout)
+
+
+def render_sheet_pack(template, copies, aruco_dir=None, widths=None):
+    """
+    One PDF with `copies` pages of the same answer sheet.
+
+    The sheet is drawn once as a ReportLab form XObject and every page only references
+    it, so each extra page costs a few bytes instead of a full redraw.
+    """
+    aruco_dir = aruco_dir or settings.ANSWER_SHEET_CONFIG['ARUCO_MARKER_DIR']
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4, invariant=1)
+    c.beginForm(SHEET_FORM_NAME)
+    draw_answer_sheet(c, template, aruco_dir, widths)
+    c.endForm()
+    for _ in range(copies):
+        c.doForm(SHEET_FORM_NAME)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
 def generate_answer_sheet(template, output_dir=None, aruco_dir=None, widths=None, file_id=None):
     """Generate answer sheet PDF and JSON metadata"""
     pdf_path = None
@@ -278,91 +459,23 @@ def generate_answer_sheet(template, output_dir=None, aruco_dir=None, widths=None
     try:
         # Use default directories from settings if not provided
         output_dir = output_dir or settings.ANSWER_SHEET_CONFIG['OUTPUT_DIR']
-        aruco_dir = aruco_dir or settings.ANSWER_SHEET_CONFIG['ARUCO_MARKER_DIR']
 
         # Create output directory if not exists
         os.makedirs(output_dir, exist_ok=True)
         os.makedirs(settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'], exist_ok=True)
 
-        # Generate PDF
+        pdf_bytes, png_bytes, output_data = render_answer_sheet(template, aruco_dir=aruco_dir, widths=widths)
+
         pdf_path = os.path.join(output_dir, f'{file_id}.pdf')
-        c = canvas.Canvas(pdf_path, pagesize=A4)
-
-        # Draw borders for ID regions
-        highlight_regions = {"student_id", "quiz_id", "class_id"}
-        border_color = (0.3, 0.3, 0.3)  # màu xám trung tính
-
-        for region, (x, y, w, h) in REGIONS.items():
-            if region in highlight_regions:
-                c.setStrokeColorRGB(*border_color)
-                c.rect(x, y, w, h)
-
-        # Get marker positions and draw them
-        marker_positions = get_marker_positions(REGIONS)
-        aruco_markers = draw_aruco_markers(c, marker_positions, aruco_dir)
-
-        # Lấy labels và widths động
-        labels = getattr(template, 'labels', ["Name", "Quiz", "Class", "Score"])
-        if widths is None:
-            widths = getattr(template, 'widths', ["Medium"] * len(labels))
-        info_data = draw_info_fill(c, REGIONS["info_fill"], labels, widths)
-        student_id_data = draw_id_section(c, REGIONS["student_id"], "Student ID", template.student_id_digits)
-        quiz_id_data = draw_id_section(c, REGIONS["quiz_id"], "Quiz ID", template.exam_id_digits)
-        class_id_data = draw_id_section(c, REGIONS["class_id"], "Class ID", template.class_id_digits)
-        answer_data = draw_answer_area(c, REGIONS["answer_area"], template.num_questions, template.num_options)
-
-        c.save()
-
-        # Generate preview image
+        with open(pdf_path, 'wb') as f:
+            f.write(pdf_bytes)
+
         preview_path = os.path.join(
             settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'],
             f'{file_id}_preview.png'
         )
-        doc = fitz.open(pdf_path)
-        page = doc[0]
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-        pix.save(preview_path)
-        doc.close()
-
-        # Convert coordinates to image space
-        output_data = {
-            "aruco_marker": aruco_markers,
-            "info_section": info_data,
-            "student_id_section": student_id_data,
-            "quiz_id_section": quiz_id_data,
-            "class_id_section": class_id_data,
-            "answer_area": answer_data
-        }
-
-        # Convert ArUCo markers
-        for marker in output_data["aruco_marker"]:
-            marker["position"] = convert_point(marker["position"])
-            marker["size"] = int(marker["size"] * scale_factor)
-
-        # Convert info section
-        output_data["info_section"]["position"] = convert_box(output_data["info_section"]["position"])
-        for field in output_data["info_section"]["fields"]:
-            field["label_pos"] = convert_point(field["label_pos"])
-            field["line"]["start"] = convert_point(field["line"]["start"])
-            field["line"]["end"] = convert_point(field["line"]["end"])
-
-        # Convert ID sections
-        for key in ["student_id_section", "quiz_id_section", "class_id_section"]:
-            section = output_data[key]
-            section["position"] = convert_box(section["position"])
-            for col in section["columns"]:
-                new_bubbles = []
-                for bubble in col["bubbles"]:
-                    new_bubbles.append(convert_bubble(bubble))
-                col["bubbles"] = new_bubbles
-
-        # Convert answer area
-        output_data["answer_area"]["position"] = convert_box(output_data["answer_area"]["position"])
-        for question in output_data["answer_area"]["questions"]:
-            new_bubbles = []
-            for bubble in question["bubbles"]:
-                new_bubbles.append(convert_bubble(bubble))
-            question["bubbles"] = new_bubbles
+        with open(preview_path, 'wb') as f:
+            f.write(png_bytes)
 
         # Save JSON metadata
         json_path = os.path.join(output_dir, f'{file_id}.json')
@@ -382,41 +495,6 @@ def generate_answer_sheet(template, output_dir=None, aruco_dir=None, widths=None
                     logger.error(f"Error cleaning up file {path}: {str(cleanup_error)}")
         raise
 
-def cleanup_old_backups(output_dir=None, max_backups=None):
-    """Clean up old backup files"""
-    try:
-        output_dir = output_dir or settings.ANSWER_SHEET_CONFIG['OUTPUT_DIR']
-        max_backups = max_backups or settings.ANSWER_SHEET_CONFIG['MAX_BACKUPS']
-        
-        # Get all PDF files
-        pdf_files = [f for f in os.listdir(output_dir) if f.endswith('.pdf')]
-        
-        # Sort by modification time
-        pdf_files.sort(key=lambda x: os.path.getmtime(os.path.join(output_dir, x)))
-        
-        # Remove old files
-        while len(pdf_files) > max_backups:
-            old_file = pdf_files.pop(0)
-            old_path = os.path.join(output_dir, old_file)
-            
-            # Remove PDF and corresponding JSON
-            os.remove(old_path)
-            json_path = old_path.replace('.pdf', '.json')
-            if os.path.exists(json_path):
-                os.remove(json_path)
-            
-            # Remove preview if exists
-            preview_path = os.path.join(
-                settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'],
-                f'{os.path.splitext(old_file)[0]}_preview.png'
-            )
-            if os.path.exists(preview_path):
-                os.remove(preview_path)
-                
-    except Exception as e:
-        logger.error(f"Error cleaning up old backups: {str(e)}")
-        raise
-
 def validate_file_size(file_path, max_size_mb=None):
     """Validate file size"""
     try:
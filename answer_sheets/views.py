@@ -1,5 +1,6 @@
 # Create your views here.
 import contextlib
+import io
 
 from rest_framework import status
 from rest_framework.response import Response
@@ -10,12 +11,17 @@ import logging
 import traceback
 import os
 from datetime import datetime
-import shutil
+from answer_sheets.artifacts import acquire_artifacts, cached_preview, ensure_preview, restore_artifacts
+from answer_sheets.downloads import cached_file_response
 from answer_sheets.models import AnswerSheetTemplate
 from answer_sheets.serializers import AnswerSheetTemplateSerializer
+from bubblesheet_backend.pagination import KeysetListMixin
 from answer_sheets.utils import (
-    generate_answer_sheet,
-    cleanup_old_backups,
+    PREVIEW_SIZES,
+    preview_content_type,
+    rasterize_previews,
+    render_answer_sheet,
+    render_sheet_pack,
     validate_file_size,
     validate_file_type,
     handle_file_operation_error,
@@ -43,19 +49,35 @@ def safe_file_operation(file_path, mode='rb'):
         raise
 
 
-def safe_remove_file(file_path):
-    """Xóa file an toàn"""
-    try:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Successfully removed file: {file_path}")
-    except Exception as e:
-        logger.error(f"Error removing file {file_path}: {str(e)}")
+def attach_artifacts(template):
+    """Point a saved template at the shared PDF/JSON/PNG of its layout, rendering them if needed"""
+    key, pdf_path, json_path, png_path = acquire_artifacts(template)
+    template.artifact_key = key
+    template.file_pdf = pdf_path
+    template.file_json = json_path
+    template.preview_image = png_path
+    template.save()
+    return template
+
+
+def template_preview_path(template, size='full'):
+    """Preview of a template: the shared artifact, or the per-id file of older templates"""
+    restore_artifacts(template)
+    png_path = template.preview_image or os.path.join(
+        settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'], f'{template.id}_preview.png')
+    return ensure_preview(png_path, template.file_pdf, size)
+
 
+def preview_size(request):
+    """?size= of the preview endpoints (thumbnail, medium, full); None when it is not one of them"""
+    size = request.query_params.get('size', 'full')
+    return size if size in PREVIEW_SIZES else None
 
-class AnswerSheetTemplateViewSet(viewsets.ModelViewSet):
+
+class AnswerSheetTemplateViewSet(KeysetListMixin, viewsets.ModelViewSet):
     serializer_class = AnswerSheetTemplateSerializer
     permission_classes = [IsAuthenticated]
+    projection_fields = {name: name for name in AnswerSheetTemplateSerializer._declared_fields}
 
     def get_queryset(self):
         return AnswerSheetTemplate.objects.filter(teacher_id=self.request.user.id)
@@ -67,27 +89,12 @@ class AnswerSheetTemplateViewSet(viewsets.ModelViewSet):
             template = serializer.save()
             template.reload()
 
-            file_id = str(template.pk)
-            pdf_path = None
-            json_path = None
-
             try:
-                pdf_path, json_path = generate_answer_sheet(
-                    template=template,
-                    output_dir=settings.ANSWER_SHEET_CONFIG['OUTPUT_DIR'],
-                    aruco_dir=settings.ANSWER_SHEET_CONFIG['ARUCO_MARKER_DIR'],
-                    file_id=file_id
-                )
-
-                template.file_pdf = pdf_path
-                template.file_json = json_path
-                template.save()
-
+                attach_artifacts(template)
                 return Response(self.get_serializer(template).data, status=status.HTTP_201_CREATED)
             except Exception as e:
                 # Cleanup nếu có lỗi
-                safe_remove_file(pdf_path)
-                safe_remove_file(json_path)
+                template.delete()
                 raise e
 
         except Exception as e:
@@ -100,20 +107,20 @@ class AnswerSheetTemplateViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def preview(self, request, pk=None):
         try:
+            size = preview_size(request)
+            if size is None:
+                return Response({'error': f'size must be one of {", ".join(PREVIEW_SIZES)}'},
+                                status=status.HTTP_400_BAD_REQUEST)
             template = self.get_object()
-            preview_path = os.path.join(
-                settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'],
-                f'{template.id}_preview.png'
-            )
+            preview_path = template_preview_path(template, size)
             if not os.path.exists(preview_path):
                 logger.warning(f"Preview not found for template: {template.id}")
                 return Response(
                     {'error': 'Preview not found. Please generate the answer sheet first.'},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            logger.info(f"Serving preview for template: {template.id}")
-            f = open(preview_path, 'rb')
-            return FileResponse(f, content_type='image/png')
+            logger.info(f"Serving {size} preview for template: {template.id}")
+            return cached_file_response(request, preview_path, preview_content_type(size))
         except Exception as e:
             logger.error(f"Error getting preview: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
@@ -126,16 +133,17 @@ class AnswerSheetTemplateViewSet(viewsets.ModelViewSet):
     def download_pdf(self, request, pk=None):
         try:
             template = self.get_object()
+            restore_artifacts(template)
             logger.info(f"[DOWNLOAD PDF] Template id: {template.id}, file_pdf: {template.file_pdf}")
             if not template.file_pdf or not os.path.exists(template.file_pdf):
                 logger.error(f"[DOWNLOAD PDF] PDF file not found for template {template.id}: {template.file_pdf}")
                 return Response({'error': 'PDF file not found'}, status=status.HTTP_404_NOT_FOUND)
-            f = open(template.file_pdf, 'rb')
-            return FileResponse(
-                f,
-                as_attachment=True,
-                filename=os.path.basename(template.file_pdf),
-                content_type='application/pdf'
+            return cached_file_response(
+                request,
+                template.file_pdf,
+                'application/pdf',
+                filename=f'{template.name}.pdf',
+                as_attachment=True
             )
         except Exception as e:
             logger.error(f"[DOWNLOAD PDF] Error downloading PDF for template {pk}: {str(e)}")
@@ -145,31 +153,58 @@ class AnswerSheetTemplateViewSet(viewsets.ModelViewSet):
     def download_png(self, request, pk=None):
         try:
             template = self.get_object()
-            preview_path = os.path.join(
-                settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'],
-                f'{template.id}_preview.png'
-            )
+            preview_path = template_preview_path(template)
             logger.info(f"[DOWNLOAD PNG] Template id: {template.id}, preview_path: {preview_path}")
             if not os.path.exists(preview_path):
                 logger.error(f"[DOWNLOAD PNG] PNG file not found for template {template.id}: {preview_path}")
                 return Response({'error': 'PNG file not found'}, status=status.HTTP_404_NOT_FOUND)
-            f = open(preview_path, 'rb')
-            return FileResponse(
-                f,
-                as_attachment=True,
+            return cached_file_response(
+                request,
+                preview_path,
+                'image/png',
                 filename=f'{template.name}_preview.png',
-                content_type='image/png'
+                as_attachment=True
             )
         except Exception as e:
             logger.error(f"[DOWNLOAD PNG] Error downloading PNG for template {pk}: {str(e)}")
             return Response({'error': 'Failed to download PNG'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['get'], url_path='bulk_print')
+    def bulk_print(self, request, pk=None):
+        """Một file PDF nhiều trang (?copies=N) để in cho cả lớp"""
+        try:
+            template = self.get_object()
+            try:
+                copies = int(request.query_params.get('copies', 1))
+            except (TypeError, ValueError):
+                return Response({'error': 'copies must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            max_copies = settings.ANSWER_SHEET_CONFIG['MAX_PRINT_COPIES']
+            if not 1 <= copies <= max_copies:
+                return Response({'error': f'copies must be between 1 and {max_copies}'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            pdf_bytes = render_sheet_pack(template, copies)
+            logger.info(f"[BULK PRINT] Template id: {template.id}, copies: {copies}, size: {len(pdf_bytes)} bytes")
+            return FileResponse(
+                io.BytesIO(pdf_bytes),
+                as_attachment=True,
+                filename=f'{template.name}_{copies}_copies.pdf',
+                content_type='application/pdf'
+            )
+        except Exception as e:
+            logger.error(f"[BULK PRINT] Error generating pack for template {pk}: {str(e)}\n{traceback.format_exc()}")
+            return Response({'error': 'Failed to generate print pack'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     @action(detail=False, methods=['post'], url_path='generate_preview')
     def generate_preview(self, request):
         """
-        Nhận dữ liệu answer sheet, generate preview và trả về ảnh PNG (bytes).
+        Nhận dữ liệu answer sheet, generate preview và trả về ảnh (bytes), cỡ theo ?size=.
         """
         try:
+            size = preview_size(request)
+            if size is None:
+                return Response({'error': f'size must be one of {", ".join(PREVIEW_SIZES)}'},
+                                status=status.HTTP_400_BAD_REQUEST)
             data = request.data
             template = AnswerSheetTemplate(
                 name=data.get('name', 'Preview'),
@@ -183,18 +218,12 @@ class AnswerSheetTemplateViewSet(viewsets.ModelViewSet):
                 created_at=datetime.now().isoformat(),
                 updated_at=datetime.now().isoformat()
             )
-            from answer_sheets.utils import generate_answer_sheet
-            pdf_path, _ = generate_answer_sheet(template)
-            import fitz
-            preview_path = pdf_path.replace('.pdf', '_preview.png')
-            doc = fitz.open(pdf_path)
-            page = doc[0]
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            pix.save(preview_path)
-            doc.close()
-            f = open(preview_path, 'rb')
-            response = FileResponse(f, content_type='image/png')
-            return response
+            # Layout đã có trong kho artifact thì không cần render lại
+            image_bytes = cached_preview(template, size=size)
+            if image_bytes is None:
+                pdf_bytes, _, _ = render_answer_sheet(template, preview_zoom=None)
+                image_bytes = rasterize_previews(pdf_bytes, [size])[size]
+            return HttpResponse(image_bytes, content_type=preview_content_type(size))
         except Exception as e:
             import traceback
             logger.error(f"Error generating preview: {str(e)}\n{traceback.format_exc()}")
@@ -248,39 +277,16 @@ class AnswerSheetTemplateListCreateView(APIView):
             template.save()
             template.reload()
 
-            file_id = str(
-                getattr(template, 'pk', None) or getattr(template, 'id', None) or getattr(template, '_id', None))
-            logger.info(f"file_id to use for file naming: {file_id}")
-
-            pdf_path = None
-            json_path = None
-
             try:
-                pdf_path, json_path = generate_answer_sheet(
-                    template=template,
-                    output_dir=settings.ANSWER_SHEET_CONFIG['OUTPUT_DIR'],
-                    aruco_dir=settings.ANSWER_SHEET_CONFIG['ARUCO_MARKER_DIR'],
-                    file_id=file_id
-                )
-
-                validate_file_size(pdf_path, max_size_mb=10)
-                validate_file_type(pdf_path, ['.pdf'])
-                validate_file_type(json_path, ['.json'])
-
-                cleanup_old_backups(settings.ANSWER_SHEET_CONFIG['OUTPUT_DIR'])
-
-                template.file_pdf = pdf_path
-                template.file_json = json_path
-                template.save()
+                attach_artifacts(template)
+                validate_file_size(template.file_pdf, max_size_mb=10)
 
                 return Response(AnswerSheetTemplateSerializer(template).data, status=status.HTTP_201_CREATED)
 
             except Exception as e:
-                # Cleanup nếu có lỗi
-                safe_remove_file(pdf_path)
-                safe_remove_file(json_path)
+                # Cleanup nếu có lỗi (template.delete() trả lại tham chiếu artifact)
                 template.delete()
-                return handle_file_operation_error(e, [pdf_path, json_path])
+                return handle_file_operation_error(e, [])
 
         except Exception as e:
             logger.error(f"Error creating answer sheet: {str(e)}\n{traceback.format_exc()}")
@@ -379,18 +385,7 @@ class AnswerSheetTemplateDetailView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Delete associated files
-            safe_remove_file(template_obj.file_pdf)
-            safe_remove_file(template_obj.file_json)
-            safe_remove_file(template_obj.file_png)
-            safe_remove_file(template_obj.preview_image)
-
-            if template_obj.backup_dir and os.path.exists(template_obj.backup_dir):
-                try:
-                    shutil.rmtree(template_obj.backup_dir)
-                except Exception as e:
-                    logger.error(f"Error removing backup directory: {str(e)}")
-
+            # File đi kèm (kể cả artifact dùng chung) do AnswerSheetTemplate.delete() xử lý
             template_obj.delete()
             logger.info(f"Deleted answer sheet template {id}")
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,108 @@
+from bson import ObjectId
+from rest_framework.exceptions import APIException
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class QueryParamError(APIException):
+    status_code = 400
+    default_code = 'invalid_query'
+
+    def __init__(self, message):
+        super().__init__({'error': message})
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination of mongoengine querysets, in _id order.
+
+    Opt-in so existing clients keep getting a plain list: only when ?limit= or ?cursor=
+    is given does the response become {'results': [...], 'next_cursor': ...}, where
+    next_cursor is the value to send back as ?cursor= (None on the last page). Each page
+    is a range scan of the index from the cursor, however deep, unlike skip/offset.
+    """
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    default_limit = 100
+    max_limit = 1000
+
+    def __init__(self):
+        self.next_cursor = None
+
+    def get_limit(self, request):
+        raw = request.query_params.get(self.limit_query_param)
+        if raw is None:
+            return self.default_limit
+        try:
+            limit = int(raw)
+        except ValueError:
+            raise QueryParamError('limit must be an integer')
+        if limit < 1:
+            raise QueryParamError('limit must be positive')
+        return min(limit, self.max_limit)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.limit_query_param not in params and self.cursor_query_param not in params:
+            return None
+        limit = self.get_limit(request)
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            if not ObjectId.is_valid(cursor):
+                raise QueryParamError('Invalid cursor')
+            queryset = queryset.filter(id__gt=ObjectId(cursor))
+        # Lấy dư một bản ghi để biết còn trang sau hay không
+        page = list(queryset.order_by('id').limit(limit + 1))
+        self.next_cursor = str(page[limit - 1].id) if len(page) > limit else None
+        return page[:limit]
+
+    def get_paginated_response(self, data):
+        return Response({'results': data, 'next_cursor': self.next_cursor})
+
+
+def requested_fields(request, fields):
+    """
+    Output keys named in ?fields=a,b, None when the parameter is absent.
+    fields maps every output key of the endpoint to the document field it comes from.
+    """
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    if not names:
+        return None
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise QueryParamError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(fields)}")
+    return names
+
+
+def list_response(request, queryset, serialize, fields):
+    """
+    Response of a list endpoint: ?fields= is mapped to .only() and the serialized rows are
+    trimmed to those keys, then the page is cut by KeysetPagination if the client asked.
+
+    serialize turns a list (or queryset) of documents into a list of dicts.
+    """
+    names = requested_fields(request, fields)
+    if names:
+        queryset = queryset.only(*{fields[name] for name in names})
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    data = serialize(page if page is not None else queryset)
+    if names:
+        data = [{name: row[name] for name in names if name in row} for row in data]
+    return paginator.get_paginated_response(data) if page is not None else Response(data)
+
+
+class KeysetListMixin:
+    """list() of a generic view or viewset through list_response(); projection_fields as in requested_fields()"""
+    projection_fields = {}
+
+    def list(self, request, *args, **kwargs):
+        return list_response(
+            request,
+            self.filter_queryset(self.get_queryset()),
+            lambda documents: self.get_serializer(documents, many=True).data,
+            self.projection_fields
+        )
@@ -139,9 +139,28 @@ ANSWER_SHEET_CONFIG = {
     'ARUCO_MARKER_DIR': os.path.join(BASE_DIR, 'answer_sheets', 'aruco_markers'),
     'OUTPUT_DIR': os.path.join(MEDIA_ROOT, 'answer_sheets'),
     'PREVIEW_DIR': os.path.join(MEDIA_ROOT, 'answer_sheets', 'previews'),
-    'MAX_BACKUPS': 5,
+    'ARTIFACT_DIR': os.path.join(MEDIA_ROOT, 'answer_sheets', 'artifacts'),
+    # Dọn artifact không còn template nào dùng (lệnh prune_artifacts), theo LRU
+    'ARTIFACT_DISK_BUDGET_MB': 1024,
+    'ARTIFACT_MAX_IDLE_DAYS': 30,
+    'ARTIFACT_PRUNE_INTERVAL_SECONDS': 3600,
     'MAX_FILE_SIZE_MB': 10,
-    'ALLOWED_EXTENSIONS': ['.pdf', '.json', '.png']
+    'ALLOWED_EXTENSIONS': ['.pdf', '.json', '.png'],
+    'MAX_PRINT_COPIES': 1000,
+    'DOWNLOAD_MAX_AGE': 300,  # giây client được dùng lại bản đã tải trước khi hỏi lại bằng ETag
+    # Font Unicode cho tên học sinh in trên phiếu cá nhân hoá (tiếng Việt có dấu)
+    'NAME_FONT_PATH': os.path.join(BASE_DIR, 'answer_sheets', 'fonts', 'DejaVuSans.ttf')
+}
+
+# Grading Configuration
+GRADING_CONFIG = {
+    'MAX_WORKERS': None,  # None = số CPU của máy
+    'MAX_BATCH_FILES': 500,
+    'MAX_SCAN_BYTES': 15 * 1024 * 1024,  # một ảnh, sau khi giải nén zip
+    'MAX_BATCH_BYTES': 1024 * 1024 * 1024,  # tổng một lô, giữ trong RAM của web node
+    'WORKER_POLL_SECONDS': 2,
+    'JOB_STALE_SECONDS': 600,
+    'ALLOWED_IMAGE_EXTENSIONS': ['.jpg', '.jpeg', '.png']
 }
 
 # Default primary key field type
@@ -532,7 +532,16 @@ class _AnswerSheetListScreenState extends State<AnswerSheetListScreen> {
                                   verticalAlignment:
                                       TableCellVerticalAlignment.middle,
                                   child: Center(
-                                    child: Text('${sheetItem.name}'),
+                                    child: Column(
+                                      mainAxisSize: MainAxisSize.min,
+                                      children: [
+                                        Padding(
+                                          padding: const EdgeInsets.symmetric(vertical: 4),
+                                          child: _SheetThumbnail(key: ValueKey(sheetItem.id), sheet: sheetItem),
+                                        ),
+                                        Text('${sheetItem.name}'),
+                                      ],
+                                    ),
                                   ),
                                 ),
                                 TableCell(
@@ -708,3 +717,73 @@ class _AnswerSheetListScreenState extends State<AnswerSheetListScreen> {
     );
   }
 }
+
+// Ảnh thu nhỏ của phiếu trong bảng; bấm vào để xem cỡ medium
+class _SheetThumbnail extends StatefulWidget {
+  final AnswerSheet sheet;
+
+  const _SheetThumbnail({super.key, required this.sheet});
+
+  @override
+  State<_SheetThumbnail> createState() => _SheetThumbnailState();
+}
+
+class _SheetThumbnailState extends State<_SheetThumbnail> {
+  late Future<Uint8List> _thumbnail;
+
+  String? get _token => Provider.of<AuthProvider>(context, listen: false).token;
+
+  @override
+  void initState() {
+    super.initState();
+    _thumbnail = AnswerSheetService.getAnswerSheetPreview(widget.sheet.id, _token);
+  }
+
+  void _showPreview() {
+    showDialog(
+      context: context,
+      builder: (context) => Dialog(
+        child: FutureBuilder<Uint8List>(
+          future: AnswerSheetService.getAnswerSheetPreview(widget.sheet.id, _token, size: 'medium'),
+          builder: (context, snapshot) {
+            if (snapshot.hasData) {
+              return InteractiveViewer(child: Image.memory(snapshot.data!));
+            }
+            return SizedBox(
+              width: 200,
+              height: 200,
+              child: Center(
+                child: snapshot.hasError
+                    ? const Icon(Icons.broken_image, color: Colors.grey)
+                    : const CircularProgressIndicator(),
+              ),
+            );
+          },
+        ),
+      ),
+    );
+  }
+
+  @override
+  Widget build(BuildContext context) {
+    return SizedBox(
+      width: 40,
+      height: 57,
+      child: FutureBuilder<Uint8List>(
+        future: _thumbnail,
+        builder: (context, snapshot) {
+          if (snapshot.hasData) {
+            return InkWell(
+              onTap: _showPreview,
+              child: Image.memory(snapshot.data!, fit: BoxFit.contain, gaplessPlayback: true),
+            );
+          }
+          return Icon(
+            snapshot.hasError ? Icons.broken_image : Icons.description_outlined,
+            color: Colors.grey.shade400,
+          );
+        },
+      ),
+    );
+  }
+}
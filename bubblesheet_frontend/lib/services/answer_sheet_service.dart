@@ -85,46 +85,68 @@ class AnswerSheetService {
     }
   }
 
-  static Future<Uint8List> downloadAnswerSheetPdf(String id, String? token) async {
+  // Thumbnail của danh sách có cache riêng, để một bản xem trước cỡ lớn không đẩy chúng ra
+  static final _thumbnailCache = _EtagCache(8 * 1024 * 1024);
+  static final _downloadCache = _EtagCache(32 * 1024 * 1024);
+
+  static Future<Uint8List> _downloadCached(String url, String? token, String defaultError,
+      {_EtagCache? cache}) async {
+    cache ??= _downloadCache;
+    final cached = cache.get(url);
     final response = await http.get(
-      Uri.parse('${ApiService.baseUrl}/answer-sheets/$id/download/pdf/'),
+      Uri.parse(url),
       headers: {
         'Authorization': 'Bearer $token',
+        if (cached != null) 'If-None-Match': cached.etag,
       },
     );
+    if (response.statusCode == 304 && cached != null) {
+      cache.put(url, cached.etag, cached.bytes);
+      return cached.bytes;
+    }
     if (response.statusCode == 200) {
+      final etag = response.headers['etag'];
+      if (etag != null) {
+        cache.put(url, etag, response.bodyBytes);
+      } else {
+        cache.remove(url);
+      }
       return response.bodyBytes;
-    } else {
-      String errorMsg = 'Failed to download PDF';
-      try {
-        final body = jsonDecode(response.body);
-        if (body is Map && body['error'] != null) {
-          errorMsg = body['error'].toString();
-        }
-      } catch (_) {}
-      throw Exception(errorMsg);
     }
+    String errorMsg = defaultError;
+    try {
+      final body = jsonDecode(response.body);
+      if (body is Map && body['error'] != null) {
+        errorMsg = body['error'].toString();
+      }
+    } catch (_) {}
+    throw Exception(errorMsg);
   }
 
-  static Future<Uint8List> downloadAnswerSheetPng(String id, String? token) async {
-    final response = await http.get(
-      Uri.parse('${ApiService.baseUrl}/answer-sheets/$id/download/png/'),
-      headers: {
-        'Authorization': 'Bearer $token',
-      },
+  static Future<Uint8List> downloadAnswerSheetPdf(String id, String? token) {
+    return _downloadCached(
+      '${ApiService.baseUrl}/answer-sheets/$id/download/pdf/',
+      token,
+      'Failed to download PDF',
+    );
+  }
+
+  static Future<Uint8List> downloadAnswerSheetPng(String id, String? token) {
+    return _downloadCached(
+      '${ApiService.baseUrl}/answer-sheets/$id/download/png/',
+      token,
+      'Failed to download PNG',
+    );
+  }
+
+  // size: 'thumbnail' (WebP ~240px) cho danh sách, 'medium' (WebP ~640px), 'full' (PNG)
+  static Future<Uint8List> getAnswerSheetPreview(String id, String? token, {String size = 'thumbnail'}) {
+    return _downloadCached(
+      '${ApiService.baseUrl}/answer-sheets/$id/preview/?size=$size',
+      token,
+      'Failed to load preview',
+      cache: size == 'thumbnail' ? _thumbnailCache : _downloadCache,
     );
-    if (response.statusCode == 200) {
-      return response.bodyBytes;
-    } else {
-      String errorMsg = 'Failed to download PNG';
-      try {
-        final body = jsonDecode(response.body);
-        if (body is Map && body['error'] != null) {
-          errorMsg = body['error'].toString();
-        }
-      } catch (_) {}
-      throw Exception(errorMsg);
-    }
   }
 
   static Future<void> deleteAnswerSheet(String id, String? token) async {
@@ -134,6 +156,8 @@ class AnswerSheetService {
         'Authorization': 'Bearer $token',
       },
     );
+    _thumbnailCache.removeWhere((url) => url.contains('/answer-sheets/$id/'));
+    _downloadCache.removeWhere((url) => url.contains('/answer-sheets/$id/'));
     if (response.statusCode != 204) {
       String errorMsg = 'Failed to delete answer sheet';
       try {
@@ -147,4 +171,40 @@ class AnswerSheetService {
   }
 
   // Thêm các hàm create, delete, ... nếu cần
-} 
\ No newline at end of file
+} 
+
+// Bản đã tải theo URL, kèm ETag để hỏi lại server bằng If-None-Match.
+// LRU giới hạn theo tổng dung lượng: Map giữ thứ tự chèn, bản dùng gần nhất được chèn lại
+// ở cuối và bản cũ nhất bị bỏ khi vượt quá maxBytes
+class _EtagCache {
+  _EtagCache(this.maxBytes);
+
+  final int maxBytes;
+  final Map<String, ({String etag, Uint8List bytes})> _entries = {};
+  int _bytes = 0;
+
+  ({String etag, Uint8List bytes})? get(String url) => _entries[url];
+
+  void remove(String url) {
+    final removed = _entries.remove(url);
+    if (removed != null) {
+      _bytes -= removed.bytes.length;
+    }
+  }
+
+  void removeWhere(bool Function(String url) test) {
+    _entries.keys.where(test).toList().forEach(remove);
+  }
+
+  void put(String url, String etag, Uint8List bytes) {
+    remove(url);
+    if (bytes.length > maxBytes) {
+      return;
+    }
+    _entries[url] = (etag: etag, bytes: bytes);
+    _bytes += bytes.length;
+    while (_bytes > maxBytes) {
+      remove(_entries.keys.first);
+    }
+  }
+}
@@ -0,0 +1,67 @@
+import logging
+
+from bson import ObjectId
+from mongoengine.queryset.visitor import Q
+
+from students.models import Student
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_students(refs, teacher_id):
+    """
+    Student _ids for a list of references (document _id or student_id), resolved with a
+    single $in query over the teacher's students. Returns (ids in request order without
+    duplicates, references that match none of them).
+    """
+    refs = [str(ref) for ref in refs]
+    object_ids = [ObjectId(ref) for ref in refs if ObjectId.is_valid(ref)]
+    students = Student.objects(teacher_id=teacher_id).filter(
+        Q(id__in=object_ids) | Q(student_id__in=refs)).only('id', 'student_id')
+    by_id, by_student_id = {}, {}
+    for student in students:
+        by_id[str(student.id)] = student.id
+        by_student_id[student.student_id] = student.id
+
+    ids, invalid = [], []
+    for ref in refs:
+        # Ưu tiên _id, sau đó mới đến student_id (như cách tìm cũ)
+        student_id = by_id.get(ref) or by_student_id.get(ref)
+        if student_id is None:
+            invalid.append(ref)
+        elif student_id not in ids:
+            ids.append(student_id)
+    return ids, invalid
+
+
+def add_to_class(class_id, student_ids):
+    """$addToSet the class on every given student, one update_many"""
+    if not student_ids:
+        return 0
+    return Student.objects(id__in=list(student_ids)).update(add_to_set__class_codes=class_id)
+
+
+def remove_from_class(class_id, student_ids=None):
+    """$pull the class from the given students (all its students when None), one update_many"""
+    students = Student.objects(class_codes=class_id)
+    if student_ids is not None:
+        if not student_ids:
+            return 0
+        students = students.filter(id__in=list(student_ids))
+    return students.update(pull__class_codes=class_id)
+
+
+def set_class_members(class_id, old_ids, new_ids):
+    """
+    Move a class's membership from old_ids to new_ids on the student side: the added
+    students get the class, the removed ones lose it. The class document itself is left
+    to the caller. Returns (added, removed) sets of ids.
+    """
+    old, new = set(old_ids), set(new_ids)
+    added, removed = new - old, old - new
+    # $addToSet cho mọi thành viên (không chỉ học sinh mới): cùng một lệnh, và sửa luôn
+    # học sinh nằm trong student_ids mà thiếu class trong class_codes
+    add_to_class(class_id, new)
+    remove_from_class(class_id, removed)
+    logger.info(f"Class {class_id}: added {len(added)} students, removed {len(removed)}")
+    return added, removed
@@ -16,7 +16,7 @@ class Class(Document):
 
     meta = {
         'collection': 'classes',
-        'indexes': ['class_code', 'teacher_id']
+        'indexes': ['class_code', 'teacher_id', ('teacher_id', 'id')]
     }
 
     def clean(self):
@@ -3,8 +3,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import APIException
 from classes.models import Class
+from classes.membership import remove_from_class, resolve_students, set_class_members
 from classes.serializer import ClassSerializer
+from bubblesheet_backend.pagination import list_response
 from exams.models import Exam
 from students.models import Student
 from users.models import User
@@ -81,6 +84,11 @@ def test_mongo(request):
             "detail": error_msg
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Khoá trả về -> field của Class, cho ?fields=
+CLASS_LIST_FIELDS = {name: name for name in (
+    'id', 'class_code', 'class_name', 'student_count', 'teacher_id', 'student_ids', 'exam_ids')}
+
+
 class ClassListCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -92,21 +100,12 @@ class ClassListCreateView(APIView):
             else:
                 classes = Class.objects(student_ids=request.user.id)
 
-            # Convert to list of dicts
-            class_list = []
-            for class_obj in classes:
-                class_list.append({
-                    'id': str(class_obj.id),
-                    'class_code': class_obj.class_code,
-                    'class_name': class_obj.class_name,
-                    'student_count': class_obj.student_count,
-                    'teacher_id': str(class_obj.teacher_id),  # Convert ObjectId to string
-                    'student_ids': [str(id) for id in class_obj.student_ids],  # Convert ObjectIds to strings
-                    'exam_ids': [str(id) for id in class_obj.exam_ids]
-                })
-
-            return Response(class_list)
+            # ?fields=id,class_code,class_name để không tải cả student_ids / exam_ids
+            return list_response(request, classes, lambda docs: ClassSerializer(docs, many=True).data,
+                                 CLASS_LIST_FIELDS)
 
+        except APIException:
+            raise
         except Exception as e:
             logger.error(f"Error in get classes: {str(e)}")
             return Response(
@@ -254,64 +253,27 @@ class ClassDetailView(APIView):
                 )
 
             # Chỉ cập nhật danh sách sinh viên nếu thực sự có trường student_ids trong payload
+            update = {}
             if 'student_ids' in request.data:
-                # Lấy danh sách student_ids mới từ request và chuyển đổi thành ObjectId
-                new_student_ids = []
-                invalid_student_ids = []
-                for student_id in request.data.get('student_ids', []):
-                    try:
-                        # Thử tìm student bằng ObjectId
-                        try:
-                            student = Student.objects.get(id=ObjectId(student_id))
-                            new_student_ids.append(student.id)
-                        except Exception:
-                            # Thử tìm student bằng student_id
-                            student = Student.objects.get(student_id=str(student_id))
-                            new_student_ids.append(student.id)
-                    except Exception:
-                        invalid_student_ids.append(str(student_id))
+                # Một truy vấn $in cho mọi id (ObjectId hoặc student_id), chỉ trong học sinh của teacher
+                new_student_ids, invalid_student_ids = resolve_students(
+                    request.data.get('student_ids', []), request.user.id)
+                update['set__student_ids'] = new_student_ids
+                update['set__student_count'] = len(new_student_ids)
 
-                old_student_ids = class_obj.student_ids
-
-                # Chỉ thêm các student mới (chưa có trong old_student_ids)
-                students_to_add = set(new_student_ids) - set(old_student_ids)
-                for student_id in students_to_add:
-                    try:
-                        student = Student.objects.get(id=student_id)
-                        if student.teacher_id == request.user.id:  # Kiểm tra student có thuộc về teacher không
-                            if class_obj.id not in student.class_codes:
-                                student.class_codes.append(class_obj.id)
-                                student.save()
-                                logger.info(f"Added class {class_obj.class_code} to student {student.student_id}")
-                    except Exception as e:
-                        logger.error(f"Error adding student to class {student_id}: {str(e)}")
-
-                # Xóa class_id khỏi class_codes của các student bị loại khỏi lớp
-                students_to_remove = set(old_student_ids) - set(new_student_ids)
-                for student_id in students_to_remove:
-                    try:
-                        student = Student.objects.get(id=student_id)
-                        if class_obj.id in student.class_codes:
-                            student.class_codes.remove(class_obj.id)
-                            student.save()
-                            logger.info(f"Removed class {class_obj.class_code} from student {student.student_id}")
-                    except Exception as e:
-                        logger.error(f"Error removing class from student {student_id}: {str(e)}")
-
-                # Gán mới hoàn toàn danh sách student_ids và cập nhật student_count
-                class_obj.student_ids = new_student_ids
-                class_obj.student_count = len(new_student_ids)
-
-            # Cập nhật thông tin class
+            # Cập nhật thông tin class (học sinh chỉ lưu id của class nên không cần lưu lại)
             if 'class_name' in request.data:
-                class_obj.class_name = request.data['class_name']
-                # Cập nhật lại class_codes của sinh viên trong lớp này
-                for student_id in class_obj.student_ids:
-                    student = Student.objects.get(id=student_id)
-                    if class_obj.id in student.class_codes:
-                        student.save()  # Lưu lại để cập nhật thông tin lớp học
-
-            class_obj.save()
+                update['set__class_name'] = request.data['class_name']
+
+            if update:
+                old_student_ids = list(class_obj.student_ids)
+                for field, value in update.items():
+                    setattr(class_obj, field[len('set__'):], value)
+                # Kiểm tra field trong bộ nhớ trước khi ghi; clean() sẽ truy vấn lại từng student và exam
+                class_obj.validate(clean=False)
+                if 'student_ids' in request.data:
+                    students_to_add, _ = set_class_members(class_obj.id, old_student_ids, new_student_ids)
+                Class.objects(id=class_obj.id).update_one(**update)
             logger.info(f"Updated class {class_obj.class_code}")
 
             # Serialize để trả về response
@@ -347,12 +309,8 @@ class ClassDetailView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Bổ sung: Xóa class_id khỏi class_codes của từng student
-            for student_id in class_obj.student_ids:
-                student = Student.objects(id=student_id).first()
-                if student and class_obj.id in student.class_codes:
-                    student.class_codes.remove(class_obj.id)
-                    student.save()
+            # Bổ sung: Xóa class_id khỏi class_codes của mọi student, một lệnh $pull
+            remove_from_class(class_obj.id)
 
             # for exam_id in class_obj.exam_ids:
             #     exam = Exam.objects(id = exam_id).first()
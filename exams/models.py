@@ -15,7 +15,7 @@ class Exam(Document):
 
     meta = {
         'collection': 'exams',
-        'indexes': ['teacher_id', 'class_codes']
+        'indexes': ['teacher_id', 'class_codes', ('teacher_id', 'id')]
     }
 
     def clean(self):
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from exams.views import ExamListCreateView, ExamDetailView
+from exams.views import ExamListCreateView, ExamDetailView, ExamPrintPackView
 
 urlpatterns = [
     path('', ExamListCreateView.as_view(), name='exam-list-create'),
+    path('<str:pk>/print/', ExamPrintPackView.as_view(), name='exam-print-pack'),
     path('<str:pk>/', ExamDetailView.as_view(), name='exam-detail'),
 ]
\ No newline at end of file
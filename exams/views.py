@@ -4,17 +4,26 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from django.http import FileResponse
+import io
 import logging
+import traceback
 
 from exams.models import Exam
 from exams.serializers import ExamSerializer
+from bubblesheet_backend.pagination import KeysetListMixin
 from answer_keys.models import AnswerKey
+from answer_sheets.models import AnswerSheetTemplate
+from answer_sheets.personalize import render_roster_pack
+from classes.models import Class
+from students.models import Student
 
 logger = logging.getLogger(__name__)
 
-class ExamListCreateView(generics.ListCreateAPIView):
+class ExamListCreateView(KeysetListMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ExamSerializer
+    projection_fields = {name: name for name in ('id', 'name', 'class_codes', 'answersheet', 'date', 'teacher_id')}
 
     def get_queryset(self):
         return Exam.objects(teacher_id=self.request.user.id)
@@ -91,4 +100,62 @@ class ExamDetailView(generics.RetrieveUpdateDestroyAPIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def perform_delete(self, instance):
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+class ExamPrintPackView(APIView):
+    """
+    Phiếu trả lời đã điền sẵn cho từng học sinh của một lớp (?class_code=...).
+
+    Mỗi trang có tên, mã học sinh, mã lớp, mã đề và một mã QR để chấm không cần đọc
+    các ô ID. Mã đề lấy từ ?version=, nếu không có thì chia lần lượt theo các mã đề
+    của answer key.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            exam = Exam.objects(id=pk, teacher_id=request.user.id).first()
+            if not exam:
+                return Response({'error': 'Not found'}, status=404)
+            class_code = request.query_params.get('class_code')
+            if not class_code or class_code not in (exam.class_codes or []):
+                return Response({'error': 'class_code must be one of the exam classes'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            class_obj = Class.objects(class_code=class_code).first()
+            template = AnswerSheetTemplate.objects(id=exam.answersheet).first()
+            if not class_obj or not template:
+                return Response({'error': 'Class or answer sheet not found'}, status=404)
+
+            version = request.query_params.get('version')
+            if version:
+                versions = [version]
+            else:
+                answer_key = AnswerKey.objects(quiz_id=str(exam.id)).first()
+                versions = [v['version_code'] for v in (answer_key.versions if answer_key else [])] \
+                    or ['1'.zfill(template.exam_id_digits)]
+
+            # Giữ đúng thứ tự học sinh trong lớp, một truy vấn cho cả lớp
+            students = {s.id: s for s in Student.objects(id__in=class_obj.student_ids)}
+            entries = [
+                {
+                    'student_id': student.student_id,
+                    'name': f'{student.first_name} {student.last_name}',
+                    'class_code': class_code,
+                    'version': versions[i % len(versions)]
+                }
+                for i, student in enumerate(s for s in (students.get(sid) for sid in class_obj.student_ids) if s)
+            ]
+            if not entries:
+                return Response({'error': 'Class has no students'}, status=status.HTTP_400_BAD_REQUEST)
+
+            pdf_bytes, pages = render_roster_pack(template, str(exam.id), entries)
+            logger.info(f"[PRINT PACK] Exam id: {exam.id}, class: {class_code}, pages: {pages}, size: {len(pdf_bytes)} bytes")
+            return FileResponse(
+                io.BytesIO(pdf_bytes),
+                as_attachment=True,
+                filename=f'{exam.name}_{class_code}.pdf',
+                content_type='application/pdf'
+            )
+        except Exception as e:
+            logger.error(f"[PRINT PACK] Error generating pack for exam {pk}: {str(e)}\n{traceback.format_exc()}")
+            return Response({'error': 'Failed to generate print pack'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,328 @@
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from bson import ObjectId
+from django.conf import settings
+
+from answer_keys.models import AnswerKey
+from answer_sheets.models import AnswerSheetTemplate
+from exams.models import Exam
+from grading.fingerprint import fingerprint_scan, same_photo, scan_sha256
+from grading.grade_pipeline import OPTIONS, grade_scan
+from grading.models import Grade
+from grading.scan_index import ScanIndex, grading_setup_hash
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_workers = 0
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process pool shared by all grading requests of this process, sized to the host's cores"""
+    global _executor, _workers
+    with _executor_lock:
+        if _executor is None:
+            _workers = settings.GRADING_CONFIG.get('MAX_WORKERS') or os.cpu_count() or 1
+            # spawn: worker không kế thừa kết nối MongoDB / thread của Django
+            _executor = ProcessPoolExecutor(max_workers=_workers, mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"Started grading process pool with {_workers} workers")
+        return _executor
+
+
+def reset_executor(broken):
+    """
+    Replace a pool that a worker crash broke (BrokenProcessPool), so the next submit
+    starts a fresh one. The pool is shared by concurrent requests: a pool that was
+    already replaced is left alone, and no future is cancelled, since those of a
+    broken pool have already failed and the other requests resubmit their own.
+    """
+    global _executor
+    with _executor_lock:
+        if broken is not _executor:
+            return
+        _executor = None
+    broken.shutdown(wait=False)
+
+
+def is_image_name(name):
+    ext = os.path.splitext(name)[1].lower()
+    return ext in settings.GRADING_CONFIG['ALLOWED_IMAGE_EXTENSIONS']
+
+
+def _read_bounded(f, name, limit):
+    """At most limit bytes of a file object, ValueError if there is more"""
+    data = f.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f"Scan {name} is too large (> {limit} bytes)")
+    return data
+
+
+def read_scans(files):
+    """
+    List of (filename, bytes) from uploaded images, expanding zip archives.
+
+    The batch limits (MAX_BATCH_FILES, MAX_SCAN_BYTES, MAX_BATCH_BYTES) are checked on
+    the zip's directory before any entry is decompressed, then again on the bytes
+    actually read, so a zip bomb is rejected without filling the memory.
+    """
+    config = settings.GRADING_CONFIG
+    max_files, max_scan, max_batch = config['MAX_BATCH_FILES'], config['MAX_SCAN_BYTES'], config['MAX_BATCH_BYTES']
+    scans = []
+    total = 0
+
+    def add(name, data):
+        nonlocal total
+        total += len(data)
+        if total > max_batch:
+            raise ValueError(f"Batch is too large (> {max_batch} bytes)")
+        scans.append((name, data))
+
+    for f in files:
+        if f.name.lower().endswith('.zip'):
+            with zipfile.ZipFile(f) as archive:
+                entries = [info for info in archive.infolist() if not info.is_dir() and is_image_name(info.filename)]
+                # Kiểm tra theo mục lục của zip trước khi giải nén
+                if len(scans) + len(entries) > max_files:
+                    raise ValueError(f"Too many scans in one batch ({len(scans) + len(entries)} > {max_files})")
+                for info in entries:
+                    if info.file_size > max_scan:
+                        raise ValueError(f"Scan {info.filename} is too large ({info.file_size} > {max_scan} bytes)")
+                if total + sum(info.file_size for info in entries) > max_batch:
+                    raise ValueError(f"Batch is too large (> {max_batch} bytes)")
+                for info in entries:
+                    # file_size chỉ là khai báo trong zip: vẫn giới hạn số byte đọc thật
+                    with archive.open(info) as entry:
+                        add(info.filename, _read_bounded(entry, info.filename, max_scan))
+        elif is_image_name(f.name):
+            if len(scans) + 1 > max_files:
+                raise ValueError(f"Too many scans in one batch ({len(scans) + 1} > {max_files})")
+            add(f.name, _read_bounded(f, f.name, max_scan))
+        else:
+            raise ValueError(f"File type not allowed: {f.name}")
+    return scans
+
+
+class GradingSetupError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def load_grading_setup(exam_id, teacher_id):
+    """Exam, answer sheet template and answer key needed to grade scans of one exam"""
+    exam = None
+    if exam_id and ObjectId.is_valid(str(exam_id)):
+        exam = Exam.objects(id=exam_id, teacher_id=teacher_id).first()
+    if not exam:
+        raise GradingSetupError('Exam not found', 404)
+    template = AnswerSheetTemplate.objects(id=exam.answersheet).first()
+    if not template or not template.file_json:
+        raise GradingSetupError('Answer sheet not found', 404)
+    answer_key = AnswerKey.objects(quiz_id=str(exam.id)).first()
+    if not answer_key or not answer_key.versions:
+        raise GradingSetupError('Answer key not found for this exam')
+    return exam, template, answer_key
+
+
+def default_class_code(exam, class_code=None):
+    """Class used when the class ID bubbles cannot be read"""
+    if not class_code and exam.class_codes and len(exam.class_codes) == 1:
+        class_code = exam.class_codes[0]
+    return class_code
+
+
+def answer_key_indices(answer_key):
+    """Map version code -> list of correct option indices, ordered by question"""
+    keys = {}
+    for version in answer_key.versions:
+        questions = sorted(version.get('questions', []), key=lambda q: q.get('order', 0))
+        keys[version['version_code']] = [OPTIONS.index(q['answer']) for q in questions]
+    return keys
+
+
+def template_key(template):
+    """Arguments of grading.layout.load_compiled_template for a template document"""
+    return template.file_json, str(template.id), template.updated_at
+
+
+def scan_index(exam, template, answer_keys):
+    """Index of the scans already graded for an exam with this template and answer key"""
+    return ScanIndex(exam.id, grading_setup_hash(template_key(template), answer_keys))
+
+
+def _submit(data, key, answer_keys, profile):
+    """Submit one scan to the current pool; (pool, future)"""
+    executor = get_executor()
+    try:
+        return executor, executor.submit(grade_scan, data, key, answer_keys, profile)
+    except BrokenProcessPool:
+        reset_executor(executor)
+        executor = get_executor()
+        return executor, executor.submit(grade_scan, data, key, answer_keys, profile)
+
+
+class _Submission:
+    """A scan on the process pool, submitted again once if a worker crash breaks the pool under it"""
+
+    def __init__(self, data, key, answer_keys, profile):
+        self.args = (data, key, answer_keys, profile)
+        self.retried = False
+        self.executor, self.future = _submit(*self.args)
+
+    def broken(self):
+        return self.future.done() and isinstance(self.future.exception(), BrokenProcessPool)
+
+    def retry_if_broken(self):
+        if self.retried or self.args is None or not self.broken():
+            return
+        reset_executor(self.executor)
+        self.retried = True
+        self.executor, self.future = _submit(*self.args)
+
+    def result(self):
+        try:
+            return self.future.result()
+        finally:
+            self.args = None  # không giữ bytes của ảnh đã chấm xong
+
+
+def _result(name, submission):
+    try:
+        result = dict(submission.result())
+        result['filename'] = name
+    except BrokenProcessPool as e:
+        logger.error(f"Grading process pool crashed again on scan {name}: {str(e)}")
+        reset_executor(submission.executor)
+        result = {'filename': name, 'error': str(e)}
+    except Exception as e:
+        logger.warning(f"Error grading scan {name}: {str(e)}")
+        result = {'filename': name, 'error': str(e)}
+    return result
+
+
+def _duplicate(index, name, digest, fingerprint=None):
+    """Stored result of an earlier copy of this scan, marked as a duplicate; None if it is new"""
+    kind, found = 'exact', index.find_exact(digest)
+    if found is None:
+        kind, found = 'similar', index.find_similar(fingerprint)
+    if found is None:
+        return None
+    result, first_name = found
+    return {**result, 'filename': name, 'duplicate_of': first_name, 'duplicate': kind}
+
+
+def _fingerprint(name, data):
+    try:
+        return fingerprint_scan(data)
+    except Exception as e:
+        # Ảnh không giải nén được: để worker chấm và báo lỗi như bình thường
+        logger.warning(f"Could not fingerprint scan {name}: {str(e)}")
+        return None
+
+
+def _collect(name, submission, index=None, digest=None, fingerprint=None):
+    result = _result(name, submission)
+    fill = result.pop('fill', None)
+    if index is None or 'error' in result:
+        return result
+    # Bản trùng cùng lô dùng chung future với bản đầu, đã được ghi vào index khi bản đầu xong
+    duplicate = _duplicate(index, name, digest, fingerprint)
+    if duplicate:
+        logger.info(f"Scan {name} is a {duplicate['duplicate']} copy of {duplicate['duplicate_of']}")
+        return duplicate
+    index.add(digest, fingerprint, result, name, fill)
+    return result
+
+
+def _next(pending, index):
+    name, digest, fingerprint, submission, ready = pending.popleft()
+    if ready is not None:
+        return ready  # bản trùng đã trả lời từ index, không chấm
+    wait([submission.future])
+    if submission.broken():
+        # Một worker chết làm hỏng cả pool: gửi lại một lần mọi scan đang chờ trên pool đó
+        logger.error(f"Grading process pool crashed on scan {name}, resubmitting the scans in flight")
+        submission.retry_if_broken()
+        for other in pending:
+            if other[3] is not None:
+                other[3].retry_if_broken()
+    return _collect(name, submission, index, digest, fingerprint)
+
+
+def iter_grade(scans, template, answer_keys, profile=False, index=None):
+    """
+    Grade (filename, bytes) scans in parallel on the process pool, yielding one result dict
+    per scan in order. scans may be a lazy iterable; only a few scans per worker are in flight.
+    With profile, every result carries its per-stage profile (see grading.profiling).
+
+    With index (scan_index()), a scan already graded for the exam is not graded again:
+    byte-identical copies are found by SHA-256, re-encoded or resized copies by a
+    fingerprint of a cheap reduced decode, both before the scan reaches a worker. Copies
+    within the batch share the grading of the first one. The result of the first copy is
+    returned with 'duplicate_of' set.
+    """
+    get_executor()
+    window = 2 * _workers
+    key = template_key(template)
+    pending = deque()
+    inflight = {}
+    inflight_prints = []
+    for name, data in scans:
+        digest = fingerprint = None
+        if index is not None:
+            digest = scan_sha256(data)
+            duplicate = _duplicate(index, name, digest)
+            if duplicate is None:
+                fingerprint = _fingerprint(name, data)
+                duplicate = _duplicate(index, name, digest, fingerprint)
+            if duplicate:
+                logger.info(f"Scan {name} is a {duplicate['duplicate']} copy of {duplicate['duplicate_of']}, not graded")
+                pending.append((name, digest, fingerprint, None, duplicate))
+                continue
+        submission = inflight.get(digest) if digest is not None else None
+        if submission is None and fingerprint is not None:
+            submission = next((other for other_print, other in inflight_prints if same_photo(fingerprint, other_print)), None)
+        if submission is None:
+            submission = _Submission(data, key, answer_keys, profile)
+            if digest is not None:
+                inflight[digest] = submission
+            if fingerprint is not None:
+                inflight_prints.append((fingerprint, submission))
+        pending.append((name, digest, fingerprint, submission, None))
+        if len(pending) >= window:
+            yield _next(pending, index)
+    while pending:
+        yield _next(pending, index)
+
+
+def grade_batch(scans, template, answer_keys, profile=False, index=None):
+    """Grade scans in parallel on the process pool; one result dict per scan, in order"""
+    return list(iter_grade(scans, template, answer_keys, profile, index))
+
+
+def save_grade(exam, result, class_code=None):
+    """Create or update the Grade of one graded sheet; returns the grade id"""
+    if result.get('exam_id') and result['exam_id'] != str(exam.id):
+        raise ValueError(f"Sheet was printed for another exam ({result['exam_id']})")
+    if not result.get('student_id'):
+        raise ValueError("Student ID could not be read")
+    class_code = result.get('class_id') or class_code
+    if not class_code:
+        raise ValueError("Class ID could not be read")
+
+    grade = Grade.objects(exam_id=str(exam.id), student_id=result['student_id']).modify(
+        upsert=True,
+        new=True,
+        set__class_code=class_code,
+        set__score=result['score'],
+        set__answers=result['answers']
+    )
+    return str(grade.id)
@@ -0,0 +1,292 @@
+"""
+Offline benchmark of the OMR grading path.
+
+Renders answer sheets with answer_sheets.utils.generate_answer_sheet, fills bubbles like a
+student would, photographs them synthetically (perspective, lighting, blur, noise, JPEG)
+and grades them with grade_pipeline, timing every stage and checking the result against
+what was filled. Needs no database or network:
+
+    python -m grading.benchmark --questions 40 100 --options 4 5 --sheets 10 --output report.json
+    python -m grading.benchmark --baseline report.json --max-regression 0.2
+
+With --baseline the exit code is 1 when the median time per sheet of any configuration
+got slower than the baseline by more than --max-regression.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import types
+
+import cv2
+import numpy as np
+
+from grading.grade_pipeline import OPTIONS, grade_sheet
+from grading.ingest import load_scan
+from grading.layout import load_compiled_template
+from grading.profiling import StageProfiler
+
+RENDER_DPI = 300
+PHOTO_SIZE = (3024, 4032)  # ảnh điện thoại 12 MP, dọc
+JPEG_QUALITY = 85
+STAGES = ['decode', 'grayscale', 'detect', 'homography', 'qr', 'warp', 'score', 'id_read']
+
+
+def configure_django(output_dir):
+    """Minimal settings for generate_answer_sheet when run outside manage.py"""
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(ANSWER_SHEET_CONFIG={
+            'ARUCO_MARKER_DIR': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             'answer_sheets', 'aruco_markers'),
+            'OUTPUT_DIR': output_dir,
+            'PREVIEW_DIR': os.path.join(output_dir, 'previews'),
+        })
+
+
+def render_sheet(num_questions, num_options, output_dir):
+    """Blank sheet rasterized at the template resolution, and the path of its JSON layout"""
+    import fitz  # PyMuPDF
+    from answer_sheets.utils import generate_answer_sheet
+
+    file_id = f'bench_{num_questions}_{num_options}'
+    template = types.SimpleNamespace(
+        id=file_id, labels=['Name', 'Quiz', 'Class', 'Score'], widths=None,
+        student_id_digits=6, exam_id_digits=3, class_id_digits=3,
+        num_questions=num_questions, num_options=num_options
+    )
+    pdf_path, json_path = generate_answer_sheet(template, output_dir=output_dir)
+
+    from django.conf import settings
+    preview_path = os.path.join(settings.ANSWER_SHEET_CONFIG['PREVIEW_DIR'], f'{file_id}_preview.png')
+    if os.path.exists(preview_path):
+        os.remove(preview_path)
+
+    zoom = RENDER_DPI / 72
+    with fitz.open(pdf_path) as doc:
+        pix = doc[0].get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY)
+    page = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).copy()
+    return page, json_path
+
+
+def fill_bubble(page, bubble, rng):
+    """Pencil mark: a slightly smaller, not quite black, off-center disc"""
+    r = int(bubble['radius'])
+    x, y = (int(v) for v in bubble['position'])
+    jitter = rng.integers(-2, 3, size=2)
+    radius = max(1, int(r * rng.uniform(0.75, 0.95)))
+    cv2.circle(page, (x + int(jitter[0]), y + int(jitter[1])), radius, int(rng.integers(20, 90)), -1)
+
+
+def fill_sheet(page, template, versions, rng, blank_rate=0.03):
+    """Fill random answers and IDs; returns the filled page and what was filled"""
+    page = page.copy()
+    answers = []
+    for q in template.questions:
+        if rng.random() < blank_rate:
+            answers.append([])
+            continue
+        choice = int(rng.integers(0, len(q['bubbles'])))
+        fill_bubble(page, q['bubbles'][choice], rng)
+        answers.append([choice])
+
+    ids = {}
+    for label, sec in template.id_sections.items():
+        if label == 'quiz':
+            digits = versions[int(rng.integers(0, len(versions)))]
+        else:
+            digits = ''.join(str(d) for d in rng.integers(0, 10, size=len(sec['columns'])))
+        for col, digit in zip(sec['columns'], digits):
+            fill_bubble(page, col['bubbles'][int(digit)], rng)
+        ids[label] = digits
+    return page, answers, ids
+
+
+def photograph(page, rng, photo_size=PHOTO_SIZE):
+    """Simulate a phone photo of a printed page; returns JPEG bytes"""
+    h, w = page.shape
+    pw, ph = photo_size
+
+    # Phối cảnh: trang chiếm ~85% ảnh, các góc lệch ngẫu nhiên
+    scale = 0.85 * min(pw / w, ph / h)
+    cx, cy = pw / 2, ph / 2
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = np.float32([[cx + (x - w / 2) * scale, cy + (y - h / 2) * scale] for x, y in src])
+    dst += rng.uniform(-0.04, 0.04, size=(4, 2)).astype(np.float32) * np.float32([pw, ph])
+    M = cv2.getPerspectiveTransform(src, dst)
+    photo = cv2.warpPerspective(page, M, (pw, ph), flags=cv2.INTER_LINEAR,
+                                borderValue=int(rng.integers(60, 140))).astype(np.float32)
+
+    # Ánh sáng không đều: gradient tuyến tính và tối ở các góc
+    yy, xx = np.mgrid[0:ph, 0:pw].astype(np.float32)
+    angle = rng.uniform(0, 2 * np.pi)
+    ramp = (np.cos(angle) * (xx / pw - 0.5) + np.sin(angle) * (yy / ph - 0.5))
+    vignette = ((xx / pw - 0.5) ** 2 + (yy / ph - 0.5) ** 2)
+    photo *= 1.0 - rng.uniform(0.0, 0.35) * (ramp + 0.5) - rng.uniform(0.0, 0.4) * vignette
+
+    sigma = rng.uniform(0.0, 1.5)
+    if sigma > 0.3:
+        photo = cv2.GaussianBlur(photo, (0, 0), sigma)
+    photo += rng.normal(0.0, rng.uniform(0.0, 8.0), size=photo.shape).astype(np.float32)
+
+    photo = cv2.cvtColor(np.clip(photo, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    ok, buf = cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise RuntimeError("Could not encode synthetic photo")
+    return buf.tobytes()
+
+
+def grade_profiled(image_bytes, template, answer_keys):
+    """Decode and grade one scan, timing every stage (allocation tracking off, it skews timings)"""
+    profiler = StageProfiler(track_allocations=False)
+    with profiler.stage('decode'):
+        gray = load_scan(image_bytes, template.size)
+    result = grade_sheet(gray, template, answer_keys, profiler)
+    return result, profiler.as_dict()
+
+
+def summarize(values):
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return None
+    return {
+        'mean': round(float(values.mean()), 3),
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'max': round(float(values.max()), 3)
+    }
+
+
+def bench_config(num_questions, num_options, sheets, rng, output_dir, versions=('001', '002')):
+    page, json_path = render_sheet(num_questions, num_options, output_dir)
+
+    start = time.perf_counter()
+    load_compiled_template.cache_clear()
+    template = load_compiled_template(json_path)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    answer_keys = {v: [int(k) for k in rng.integers(0, num_options, size=num_questions)] for v in versions}
+    stage_times = {stage: [] for stage in STAGES}
+    totals = []
+    questions_ok = sheets_ok = ids_ok = failures = 0
+    errors = []
+
+    for i in range(sheets):
+        filled, answers, ids = fill_sheet(page, template, list(versions), rng)
+        data = photograph(filled, rng)
+
+        try:
+            result, profile = grade_profiled(data, template, answer_keys)
+        except Exception as e:
+            failures += 1
+            errors.append({'sheet': i, 'error': str(e)})
+            continue
+        for stage in profile['stages']:
+            stage_times[stage['name']].append(stage['ms'])
+        totals.append(profile['total_ms'])
+
+        got = [sorted(OPTIONS.index(c) for c in result['answers'].get(str(q + 1), '')) for q in range(num_questions)]
+        matched = sum(1 for g, want in zip(got, answers) if g == want)
+        questions_ok += matched
+        id_match = all(result[f'{label}_id'] == ids[label] for label in ids)
+        ids_ok += id_match
+        sheets_ok += matched == num_questions and id_match
+
+    graded = sheets - failures
+    return {
+        'num_questions': num_questions,
+        'num_options': num_options,
+        'sheets': sheets,
+        'compile_ms': round(compile_ms, 3),
+        'stages_ms': {stage: summarize(v) for stage, v in stage_times.items()},
+        'total_ms': summarize(totals),
+        'sheets_per_second': round(1000 / float(np.mean(totals)), 3) if totals else 0.0,
+        'accuracy': {
+            'questions': round(questions_ok / (graded * num_questions), 4) if graded else 0.0,
+            'ids': round(ids_ok / graded, 4) if graded else 0.0,
+            'sheets': round(sheets_ok / sheets, 4) if sheets else 0.0,
+            'failures': failures
+        },
+        'errors': errors
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Configurations whose median time per sheet regressed by more than max_regression"""
+    previous = {(c['num_questions'], c['num_options']): c for c in baseline.get('configs', [])}
+    regressions = []
+    for config in report['configs']:
+        old = previous.get((config['num_questions'], config['num_options']))
+        if not old or not old.get('total_ms') or not config.get('total_ms'):
+            continue
+        ratio = config['total_ms']['p50'] / old['total_ms']['p50'] - 1
+        if ratio > max_regression:
+            regressions.append({
+                'num_questions': config['num_questions'],
+                'num_options': config['num_options'],
+                'baseline_p50_ms': old['total_ms']['p50'],
+                'p50_ms': config['total_ms']['p50'],
+                'regression': round(ratio, 4)
+            })
+    return regressions
+
+
+def run(questions, options, sheets, seed=0, output_dir=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = output_dir or tmp
+        configure_django(output_dir)
+        rng = np.random.default_rng(seed)
+        configs = [bench_config(nq, no, sheets, rng, output_dir) for nq in questions for no in options]
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'seed': seed,
+        'environment': environment(),
+        'configs': configs
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the answer sheet grading pipeline on synthetic scans')
+    parser.add_argument('--questions', type=int, nargs='+', default=[40, 100])
+    parser.add_argument('--options', type=int, nargs='+', default=[4, 5])
+    parser.add_argument('--sheets', type=int, default=5, help='Synthetic scans per configuration')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--baseline', help='Previous JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed slowdown of the median time per sheet, as a fraction')
+    args = parser.parse_args(argv)
+
+    # PyMuPDF in thông báo ra stdout, giữ stdout chỉ cho báo cáo JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args.questions, args.options, args.sheets, args.seed)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(report, json.load(f), args.max_regression)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
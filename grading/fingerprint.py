@@ -0,0 +1,69 @@
+import hashlib
+
+import cv2
+import numpy as np
+
+from grading.ingest import load_scan
+
+# pHash: DCT 32x32, giữ 8x8 tần số thấp -> 64 bit
+PHASH_SIZE = 32
+PHASH_BITS = 8
+PHASH_MAX_DISTANCE = 6
+
+# Chữ ký ô lưới: đủ mịn để mỗi bong bóng chiếm ~1-2 ô, nên hai phiếu tô khác nhau
+# khác hẳn nhau dù pHash (chỉ thấy bố cục trang) gần như trùng
+SIGNATURE_SIZE = (96, 128)
+SIGNATURE_MAX_DIFF = 40
+
+# Dấu vân tay lấy từ ảnh giải nén thu nhỏ (cạnh dài >= 10% template, ~350 px):
+# rẻ hơn nhiều so với chấm, đủ mịn cho lưới 96x128
+FINGERPRINT_SCALE = 0.1
+
+
+def scan_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(gray):
+    """64-bit DCT hash of the whole photo, as a signed int so it fits a Mongo long"""
+    small = cv2.resize(gray, (PHASH_SIZE, PHASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:PHASH_BITS, :PHASH_BITS].flatten()
+    bits = low[1:] > np.median(low[1:])  # bỏ thành phần DC (độ sáng chung)
+    value = int(np.packbits(np.concatenate([[False], bits])).view('>u8')[0])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def mark_signature(gray):
+    """Coarse grid of the photo with brightness stretched to 0-255, as bytes"""
+    grid = cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+    low, high = np.percentile(grid, (1, 99))
+    grid = (grid - low) * (255.0 / max(high - low, 1.0))
+    return np.clip(grid, 0, 255).astype(np.uint8).tobytes()
+
+
+def scan_fingerprint(gray):
+    return {'phash': perceptual_hash(gray), 'signature': mark_signature(gray)}
+
+
+def fingerprint_scan(data):
+    """Fingerprint of an uploaded photo from a cheap reduced decode, taken before it is graded"""
+    return scan_fingerprint(load_scan(data, min_scale=FINGERPRINT_SCALE))
+
+
+def hamming(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count('1')
+
+
+def same_scan(signature, other):
+    """True when two signatures show the same photo (re-encoded, resized), not just the same sheet layout"""
+    a = np.frombuffer(signature, dtype=np.uint8).astype(np.int16)
+    b = np.frombuffer(other, dtype=np.uint8).astype(np.int16)
+    if a.shape != b.shape:
+        return False
+    return int(np.abs(a - b).max()) <= SIGNATURE_MAX_DIFF
+
+
+def same_photo(fingerprint, other):
+    """True when two fingerprints show the same photo: close pHashes confirmed by the signatures"""
+    return (hamming(fingerprint['phash'], other['phash']) <= PHASH_MAX_DISTANCE
+            and same_scan(fingerprint['signature'], other['signature']))
@@ -1,7 +1,16 @@
+import logging
+from functools import lru_cache
+
 import cv2
 import numpy as np
-import json
-from aruco_dict import ARUCO_DICT
+from grading.aruco_dict import ARUCO_DICT
+from grading.ingest import load_scan
+from grading.layout import ID_SECTIONS, load_compiled_template
+from grading.profiling import NULL_PROFILER, StageProfiler, log_profile
+from grading.scoring import BubbleStencil, CompiledAnswerKey
+from grading.sheet_qr import decode_sheet_qr
+
+logger = logging.getLogger(__name__)
 
 # --- Cấu hình chung ---
 ARUCO_TYPE = 'DICT_4X4_50'
@@ -27,6 +36,16 @@ COLORS = {
 }
 FONT = cv2.FONT_HERSHEY_SIMPLEX
 
+# Dò ArUco trên ảnh thu nhỏ (cạnh dài nhất), rồi tinh chỉnh góc trên ảnh gốc
+ARUCO_DETECT_MAX_SIDE = 1600
+ARUCO_SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+# Vùng QR: pixel tối hơn QR_INK_LEVEL * độ sáng giấy là mực; cần ít nhất QR_MIN_INK diện tích
+QR_INK_LEVEL = 0.6
+QR_MIN_INK = 0.1
+
+OPTIONS = 'ABCDE'
+
 # Answer key mẫu (thay bằng của bạn nếu khác)
 ANSWER_KEY = {0: 2, 1: 3, 2: 4, 3: 0, 4: 4, 5: 3, 6: 2, 7: 1, 8: 4, 9: 3, 10: 0, 11: 3, 12: 0, 13: 2, 14: 1, 15: 1,
               16: 2, 17: 2, 18: 0, 19: 4, 20: 0, 21: 1, 22: 1, 23: 2, 24: 3,
@@ -39,64 +58,112 @@ ANSWER_KEY = {0: 2, 1: 3, 2: 4, 3: 0, 4: 4, 5: 3, 6: 2, 7: 1, 8: 4, 9: 3, 10: 0,
 
 
 def load_data(img_path, json_path):
-    img = cv2.imread(img_path)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    with open(json_path, 'r') as f:
-        data = json.load(f)
-    return img, gray, data
+    template = load_compiled_template(json_path)
+    with open(img_path, 'rb') as f:
+        gray = load_scan(f.read(), template.size)
+    # Ảnh màu chỉ dùng để vẽ kết quả kiểm tra
+    img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    return img, gray, template
 
 
-def detect_aruco(gray, aruco_type):
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    gray = clahe.apply(blurred)
+@lru_cache(maxsize=None)
+def get_aruco_detector(aruco_type):
+    """ArUco detector built once per process and dictionary type"""
     arucoDict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT[aruco_type])
     arucoParams = cv2.aruco.DetectorParameters()
-    arucoDetector = cv2.aruco.ArucoDetector(arucoDict, arucoParams)
-    (corners, ids, _) = arucoDetector.detectMarkers(gray)
-    positions = []
-    if ids is not None:
-        ids = ids.flatten()
-        for markerCorner, markerID in zip(corners, ids):
-            corners_reshaped = markerCorner.reshape((4, 2))
-            (topLeft, topRight, bottomRight, bottomLeft) = corners_reshaped
-            cX = int((topLeft[0] + bottomRight[0]) / 2.0)
-            cY = int((topLeft[1] + bottomRight[1]) / 2.0)
-
-            positions.append({'id': int(markerID), 'position': [cX, cY]})
-    return positions
+    return cv2.aruco.ArucoDetector(arucoDict, arucoParams)
+
+
+def _detect_markers(gray, aruco_type):
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    (corners, ids, _) = get_aruco_detector(aruco_type).detectMarkers(clahe.apply(blurred))
+    if ids is None:
+        return [], np.empty(0, dtype=np.int32)
+    return [c.reshape((4, 2)) for c in corners], ids.flatten()
 
 
-def warp_to_template(img, detected, template_markers):
-    input_points, template_points = [], []
+def _refine_corners(gray, corners, scale):
+    """Move corners found on a downscaled image to sub-pixel positions on the full-resolution one"""
+    points = np.concatenate(corners).astype(np.float32) / scale
+    # Cửa sổ đủ lớn để bù sai số do thu nhỏ ảnh
+    win = int(np.ceil(1 / scale)) + 2
+    cv2.cornerSubPix(gray, points, (win, win), (-1, -1), ARUCO_SUBPIX_CRITERIA)
+    return np.split(points, len(corners))
 
-    for marker in template_markers:
-        marker_id = marker["id"]
 
-        matching_marker = next((m for m in detected if m["id"] == marker_id), None)
-        if matching_marker:
-            input_points.append(matching_marker["position"])
-            template_points.append(marker["position"])
+def detect_aruco(gray, aruco_type):
+    """
+    Centers of the ArUco markers in a grayscale photo.
+
+    Large photos are searched on a downscaled copy first and only the found corners are
+    refined on the full-resolution image; the full image is searched only when the
+    downscaled pass finds fewer than 4 markers.
+    """
+    scale = min(1.0, ARUCO_DETECT_MAX_SIDE / max(gray.shape[:2]))
+    corners, ids = [], []
+    if scale < 1.0:
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        corners, ids = _detect_markers(small, aruco_type)
+        if len(ids) >= 4:
+            corners = _refine_corners(gray, corners, scale)
+    if len(ids) < 4:
+        corners, ids = _detect_markers(gray, aruco_type)
+
+    positions = []
+    for corners_reshaped, markerID in zip(corners, ids):
+        (topLeft, topRight, bottomRight, bottomLeft) = corners_reshaped
+        cX = float((topLeft[0] + bottomRight[0]) / 2.0)
+        cY = float((topLeft[1] + bottomRight[1]) / 2.0)
 
-    input_points = np.array(input_points, dtype=np.float32)
-    template_points = np.array(template_points, dtype=np.float32)
+        positions.append({'id': int(markerID), 'position': [cX, cY]})
+    return positions
 
+
+def find_homography(detected, template):
+    input_points, template_points = template.match_markers(detected)
+    if len(input_points) < 4:
+        raise ValueError(f"At least 4 ArUco markers are required, found {len(input_points)}")
     H, _ = cv2.findHomography(input_points, template_points, cv2.RANSAC)
-    (w, h) = (2481, 3508)
+    if H is None:
+        raise ValueError("Could not estimate sheet perspective from ArUco markers")
+    return H
+
+
+def warp_to_template(img, detected, template, save_path=None):
+    H = find_homography(detected, template)
+    (w, h) = template.size
     warped = cv2.warpPerspective(img, H, (w, h))
-    cv2.imwrite(WARPED_IMAGE, warped)
+    if save_path:
+        cv2.imwrite(save_path, warped)
     return warped
 
 
-def verify_warp(image, data):
+def warp_region(img, H, origin, size):
+    """Warp only one rectangle of the template: shift the homography so the rectangle lands at (0, 0)"""
+    x, y = origin
+    shift = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=np.float64)
+    return cv2.warpPerspective(img, shift @ H, tuple(size))
+
+
+def stencil_region(gray, stencil, H=None):
+    """
+    Pixels under a stencil. With H, gray is the original photo and only the stencil's
+    rectangle is warped; without it, gray is an already warped page and is just cropped.
+    """
+    if H is None:
+        return stencil.crop(gray)
+    return warp_region(gray, H, stencil.origin, stencil.size)
+
+
+def verify_warp(image, template):
     # Vẽ marker
-    for m in data['aruco_marker']:
-        cx, cy = m['position']
-        r = m.get('size', 50) // 2
+    for marker_id, (cx, cy), size in zip(template.marker_ids, template.marker_points, template.marker_sizes):
+        cx, cy, r = int(cx), int(cy), int(size) // 2
         pts = [(cx - r, cy - r), (cx + r, cy - r), (cx + r, cy + r), (cx - r, cy + r)]
         for i in range(4):
             cv2.line(image, pts[i], pts[(i + 1) % 4], COLORS['wrong'], 2)
-        cv2.putText(image, str(m['id']), (cx - 10, cy - 10), FONT, 0.5, COLORS['wrong'], 1)
+        cv2.putText(image, str(marker_id), (cx - 10, cy - 10), FONT, 0.5, COLORS['wrong'], 1)
     # Vẽ vùng info, student, quiz, class, answer
     colors = {
         'info_section': (0, 255, 0),
@@ -106,44 +173,12 @@ def verify_warp(image, data):
         'answer_area': (255, 0, 255)
     }
     for name, clr in colors.items():
-        x, y, w, h = data[name]['position']
+        x, y, w, h = template.regions[name]
         cv2.rectangle(image, (x, y), (x + w, y + h), clr, 2)
         cv2.putText(image, name, (x, y - 5), FONT, 0.5, clr, 1)
     return image
 
 
-def bounding_box(bubbles, shape):
-    xs = [b['position'][0] for b in bubbles]
-    ys = [b['position'][1] for b in bubbles]
-    rs = [b['radius'] for b in bubbles]
-    x1 = max(int(min(xs) - max(rs)), 0)
-    x2 = min(int(max(xs) + max(rs)), shape[1])
-    y1 = max(int(min(ys) - max(rs)), 0)
-    y2 = min(int(max(ys) + max(rs)), shape[0])
-    return x1, y1, x2, y2
-
-
-def threshold_region(gray, box):
-    x_min, y_min, x_max, y_max = box
-    roi = gray[y_min:y_max, x_min:x_max]
-    _, thresh = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
-    return thresh, (x_min, y_min)
-
-
-def detect_marked(bubbles, thresh, min_pixels):
-    marked = []
-    for idx, b in enumerate(bubbles):
-        x0 = int(b["position"][0] - box[0])
-        y0 = int(b["position"][1] - box[1])
-        r = int(b["radius"])
-        mask = np.zeros_like(thresh)
-        cv2.circle(mask, (x0, y0), r, 255, -1)
-        cnt = cv2.countNonZero(cv2.bitwise_and(thresh, thresh, mask=mask))
-        if cnt >= min_pixels:
-            marked.append((cnt, idx))
-    return marked
-
-
 def draw_answer_circles(img, bubbles, selected, correct_idx):
     if len(selected) == 0:
         x, y = map(int, bubbles[correct_idx]['position'])
@@ -183,18 +218,16 @@ def draw_answer_circles(img, bubbles, selected, correct_idx):
             cv2.circle(img, (x, y), r, COLORS['wrong'], 3)
 
 
-def grade_answers(img, gray, questions, answer_key):
+def grade_answers(img, gray, questions, answer_key, stencil=None):
+    if stencil is None:
+        stencil = BubbleStencil([q['bubbles'] for q in questions], gray.shape)
+    counts = stencil.split(stencil.count_filled(stencil.crop(gray)))
+
     correct = 0
-    for q in questions:
+    for q, q_counts in zip(questions, counts):
         q_idx = q['question'] - 1
         bubbles = q['bubbles']
-        global box
-        box = bounding_box(bubbles, img.shape)
-        thresh, _ = threshold_region(gray, box)
-
-        marked = []
-        for cnt, idx in detect_marked(bubbles, thresh, MIN_ANSWER_PIXELS):
-            marked.append(idx)
+        marked = np.flatnonzero(q_counts >= MIN_ANSWER_PIXELS).tolist()
 
         selected, status = [], 'skipped'
         if len(marked) == 1:
@@ -215,47 +248,254 @@ def grade_answers(img, gray, questions, answer_key):
     return correct
 
 
-def read_id_section(img, gray, sec, label):
-    digits = []
-    for col in sec['columns']:
-        box, origin = bounding_box(col['bubbles'], gray.shape), None
-        thresh, origin = threshold_region(gray, box)
-        best = None
-        for b in col['bubbles']:
-            x = int(b['position'][0] - origin[0])
-            y = int(b['position'][1] - origin[1])
-            r = int(b['radius'])
-            mask = np.zeros_like(thresh, dtype=np.uint8)
-            cv2.circle(mask, (x, y), r, 255, -1)
-            cnt = cv2.countNonZero(cv2.bitwise_and(thresh, thresh, mask=mask))
-            if cnt >= MIN_ID_PIXELS[label] and (best is None or cnt > best[0]):
-                best = (cnt, b['value'], b)
-        if best is None:
+def pick_id_bubbles(counts, label):
+    """Index of the darkest bubble of every ID column, None if a column is not filled"""
+    picked = []
+    for col_counts in counts:
+        candidates = np.where(col_counts >= MIN_ID_PIXELS[label], col_counts, -1)
+        best_idx = int(np.argmax(candidates))
+        if candidates[best_idx] < 0:
             return None
-        _, val, bub = best
-        digits.append(val)
+        picked.append(best_idx)
+    return picked
+
+
+def read_id_section(img, gray, sec, label, stencil=None):
+    if stencil is None:
+        stencil = BubbleStencil([col['bubbles'] for col in sec['columns']], gray.shape)
+    picked = pick_id_bubbles(stencil.split(stencil.count_filled(stencil.crop(gray))), label)
+    if picked is None:
+        return None
+
+    digits = []
+    for col, best_idx in zip(sec['columns'], picked):
+        bub = col['bubbles'][best_idx]
+        digits.append(bub['value'])
         # highlight bubble chọn
         px, py, pr = map(int, bub['position'] + [bub['radius']])
         cv2.circle(img, (px, py), pr, COLORS['correct'], 2)
     return digits
 
 
+def marked_options(counts):
+    """Marked option indices of every question from per-question pixel counts"""
+    return [np.flatnonzero(q_counts >= MIN_ANSWER_PIXELS).tolist() for q_counts in counts]
+
+
+def fill_levels(counts, areas):
+    """Fill ratio of every bubble quantized to 0-255, the compact form kept for re-scoring"""
+    return np.round(counts * 255.0 / np.maximum(areas, 1)).astype(np.uint8)
+
+
+def filled_pixels(levels, areas):
+    """Marked pixel counts recovered from fill levels (to within half a level)"""
+    return levels.astype(np.float64) * areas / 255.0
+
+
+def marked_bubbles(levels, areas):
+    """Marked answer bubbles (bool, same shape as levels) from quantized fill levels"""
+    return filled_pixels(levels, areas) >= MIN_ANSWER_PIXELS
+
+
+@lru_cache(maxsize=32)
+def _compiled_answer_key(frozen_keys):
+    return CompiledAnswerKey(dict(frozen_keys))
+
+
+def compiled_answer_key(answer_keys):
+    """CompiledAnswerKey of a version -> option indices map, cached per process like compiled templates"""
+    return _compiled_answer_key(tuple((version, tuple(key)) for version, key in answer_keys.items()))
+
+
+def score_marked(marked, stencil, compiled_key, rows):
+    """
+    version / correct / total / score of every sheet of a marked-bubble matrix
+    (sheets x stencil bubbles), each against its answer key row. The single scoring path
+    of grading and re-grading.
+    """
+    correct, total = compiled_key.score(marked, stencil, rows)
+    return [
+        {
+            'version': compiled_key.versions[row],
+            'correct': sheet_correct,
+            'total': sheet_total,
+            'score': round(sheet_correct / sheet_total * 100, 2) if sheet_total else 0.0
+        }
+        for row, sheet_correct, sheet_total in zip(rows, correct.tolist(), total.tolist())
+    ]
+
+
+def marked_answers(marked, stencil):
+    """Answers dict (question number -> marked option letters) of one sheet's marked bubbles"""
+    return {str(q_idx + 1): ''.join(OPTIONS[i] for i in np.flatnonzero(q_marked))
+            for q_idx, q_marked in enumerate(stencil.split(marked))}
+
+
+def rescore_fills(fills, template, compiled_key, quiz_ids):
+    """
+    Score many sheets again in one pass from the fill levels stored when they were graded
+    (result['fill']), e.g. after an answer key correction. No image work; the marks do
+    not change, only version / correct / total / score.
+
+    compiled_key is a grading.scoring.CompiledAnswerKey. Returns one dict per sheet, or
+    None where the levels do not match the layout or the version is unknown.
+    """
+    stencil = template.answer_stencil
+    rows = [compiled_key.row(quiz_id) for quiz_id in quiz_ids]
+    valid = [i for i, fill in enumerate(fills)
+             if fill and len(fill) == stencil.num_bubbles and rows[i] >= 0]
+    results = [None] * len(fills)
+    if not valid:
+        return results
+
+    levels = np.frombuffer(b''.join(fills[i] for i in valid), dtype=np.uint8).reshape(len(valid), stencil.num_bubbles)
+    scored = score_marked(marked_bubbles(levels, stencil.areas), stencil, compiled_key, [rows[i] for i in valid])
+    for i, sheet in zip(valid, scored):
+        results[i] = sheet
+    return results
+
+
+def id_digits(counts, sec, label):
+    """Digits of one ID section from per-column pixel counts, None if any column is empty"""
+    picked = pick_id_bubbles(counts, label)
+    if picked is None:
+        return None
+    return ''.join(str(col['bubbles'][idx]['value']) for col, idx in zip(sec['columns'], picked))
+
+
+def read_answers(gray, template, H=None):
+    """Marked option indices of every question, without drawing anything (see stencil_region for H)"""
+    stencil = template.answer_stencil
+    return marked_options(stencil.split(stencil.count_filled(stencil_region(gray, stencil, H))))
+
+
+def read_id(gray, template, label, H=None):
+    """Digits filled in one ID section as a string, None if any column is empty (see stencil_region for H)"""
+    stencil = template.id_stencils[label]
+    counts = stencil.split(stencil.count_filled(stencil_region(gray, stencil, H)))
+    return id_digits(counts, template.id_sections[label], label)
+
+
+@lru_cache(maxsize=None)
+def get_qr_detector():
+    return cv2.QRCodeDetector()
+
+
+def read_sheet_qr(gray, template, H):
+    """IDs from the QR code printed on a personalized sheet (answer_sheets.personalize), None if absent"""
+    x, y, w, h = template.qr_region
+    if w <= 0 or h <= 0:
+        return None
+    region = warp_region(gray, H, (x, y), (w, h))
+    # Vùng trống trên phiếu thường thì bỏ qua, không chạy bộ dò QR (tốn ~30 ms)
+    paper = np.percentile(region, 95)
+    if np.count_nonzero(region < paper * QR_INK_LEVEL) < region.size * QR_MIN_INK:
+        return None
+    text, _, _ = get_qr_detector().detectAndDecode(region)
+    return decode_sheet_qr(text)
+
+
+def grade_sheet(img, template, answer_keys, profiler=NULL_PROFILER):
+    """
+    Grade one photographed sheet.
+
+    answer_keys maps a version code (the quiz ID bubbles) to the list of correct
+    option indices of that version; it is scored through its per-process
+    CompiledAnswerKey, like re-grading (score_marked). profiler (grading.profiling.StageProfiler) records
+    the time, pixels and allocations of every stage.
+    """
+    with profiler.stage('grayscale', pixels=img.shape[0] * img.shape[1]):
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    with profiler.stage('detect', pixels=gray.size):
+        detected = detect_aruco(gray, ARUCO_TYPE)
+    with profiler.stage('homography'):
+        H = find_homography(detected, template)
+
+    # Phiếu cá nhân hoá có mã QR chứa sẵn các mã số: không cần đọc bong bóng mã số
+    with profiler.stage('qr', pixels=template.qr_region[2] * template.qr_region[3]):
+        qr = read_sheet_qr(gray, template, H)
+
+    # Chỉ warp vùng trả lời và các vùng mã số, không warp cả trang
+    stencils = {'answers': template.answer_stencil}
+    if not qr:
+        stencils.update(template.id_stencils)
+    with profiler.stage('warp', pixels=sum(s.size[0] * s.size[1] for s in stencils.values())):
+        regions = {name: stencil_region(gray, stencil, H) for name, stencil in stencils.items()}
+    with profiler.stage('score', pixels=template.answer_stencil.areas.sum()):
+        stencil = template.answer_stencil
+        # Chấm từ mức tô đã lượng tử hoá, để chấm lại từ dữ liệu lưu cho đúng kết quả này
+        levels = fill_levels(stencil.count_filled(regions['answers']), stencil.areas)
+        marked = marked_bubbles(levels, stencil.areas)
+    if qr:
+        ids = {'student': qr['student_id'], 'quiz': qr['version'], 'class': qr['class_code']}
+    else:
+        with profiler.stage('id_read', pixels=sum(template.id_stencils[label].areas.sum() for label in ID_SECTIONS)):
+            ids = {
+                label: id_digits(stencils[label].split(stencils[label].count_filled(regions[label])),
+                                 template.id_sections[label], label)
+                for label in ID_SECTIONS
+            }
+    compiled_key = compiled_answer_key(answer_keys)
+    row = compiled_key.row(ids['quiz'])
+    if row < 0:
+        raise ValueError(f"Unknown exam version: {ids['quiz']}")
+    scored, = score_marked(marked[np.newaxis], stencil, compiled_key, [row])
+
+    return {
+        'student_id': ids['student'],
+        'quiz_id': ids['quiz'],
+        'class_id': ids['class'],
+        'exam_id': qr['exam_id'] if qr else None,
+        'id_source': 'qr' if qr else 'bubbles',
+        **scored,
+        'answers': marked_answers(marked, stencil),
+        'fill': levels.tobytes()
+    }
+
+
+def grade_scan(image_bytes, template_key, answer_keys, profile=False):
+    """
+    Decode and grade one uploaded scan. Entry point of the grading worker processes.
+    With profile, the result also holds the per-stage profile of this scan.
+    """
+    profiler = StageProfiler() if profile else NULL_PROFILER
+    try:
+        with profiler.stage('template'):
+            template = load_compiled_template(*template_key)
+        with profiler.stage('decode') as record:
+            gray = load_scan(image_bytes, template.size)
+            record['pixels'] = gray.size
+        result = grade_sheet(gray, template, answer_keys, profiler)
+    finally:
+        profiler.stop()
+    if profiler.enabled:
+        result['profile'] = profiler.as_dict()
+    return result
+
+
 def main():
+    profiler = StageProfiler()
     # 1. Load
-    orig, gray, data = load_data(INPUT_IMAGE, TEMPLATE_JSON)
+    with profiler.stage('load_data'):
+        orig, gray, template = load_data(INPUT_IMAGE, TEMPLATE_JSON)
     # 2. Detect + Warp
-    det = detect_aruco(gray, ARUCO_TYPE)
-    warped = warp_to_template(orig, det, data['aruco_marker'])
-    # cv2.imwrite(WARPED_IMAGE, warped)
+    with profiler.stage('detect', pixels=gray.size):
+        det = detect_aruco(gray, ARUCO_TYPE)
+    with profiler.stage('warp', pixels=template.size[0] * template.size[1]):
+        warped = warp_to_template(orig, det, template, WARPED_IMAGE)
     # 3. Verify (tuỳ chọn: lưu file verify)
-    ver = verify_warp(warped.copy(), data)
+    ver = verify_warp(warped.copy(), template)
     cv2.imwrite('verify_warp.jpg', ver)
     # 4. Grade & Read IDs
     w_gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
-    score = grade_answers(warped, w_gray, data['answer_area']['questions'], ANSWER_KEY)
-    stu_id = read_id_section(warped, w_gray, data['student_id_section'], 'student')
-    quiz_id = read_id_section(warped, w_gray, data['quiz_id_section'], 'quiz')
-    cls_id = read_id_section(warped, w_gray, data['class_id_section'], 'class')
+    with profiler.stage('grade_answers', pixels=template.answer_stencil.areas.sum()):
+        score = grade_answers(warped, w_gray, template.questions, ANSWER_KEY, template.answer_stencil)
+    with profiler.stage('read_id_section'):
+        stu_id = read_id_section(warped, w_gray, template.id_sections['student'], 'student', template.id_stencils['student'])
+        quiz_id = read_id_section(warped, w_gray, template.id_sections['quiz'], 'quiz', template.id_stencils['quiz'])
+        cls_id = read_id_section(warped, w_gray, template.id_sections['class'], 'class', template.id_stencils['class'])
+    profiler.stop()
+    log_profile(logger, profiler.as_dict(), image=INPUT_IMAGE)
     # 5. Overlay text
     lines = [f"Score: {score}/{len(ANSWER_KEY)} = {score / len(ANSWER_KEY) * 100:.2f}%"]
     if stu_id:  lines.append("Student ID: " + ''.join(map(str, stu_id)))
@@ -270,4 +510,6 @@ def main():
     cv2.destroyAllWindows()
 
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
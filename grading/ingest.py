@@ -0,0 +1,61 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from grading.layout import TEMPLATE_SIZE
+
+# Độ phân giải làm việc tối thiểu, tính theo cạnh dài của lưới template 300 DPI:
+# 0.5 ~ 150 DPI trên tờ giấy, vẫn dư cho bong bóng và ArUco
+MIN_WORKING_SCALE = 0.5
+
+# Hệ số thu nhỏ libjpeg làm được ngay khi giải nén (DCT scaling)
+REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def image_size(data):
+    """(width, height) from the image header without decoding pixels, None if unknown"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def reduction_factor(size, template_size=TEMPLATE_SIZE, min_scale=MIN_WORKING_SCALE):
+    """
+    Largest decode-time reduction that keeps the long side of the photo at or above
+    min_scale times the long side of the template. The working image therefore ends up
+    between 1x and 2x that minimum.
+    """
+    if not size:
+        return 1
+    min_side = max(template_size) * min_scale
+    long_side = max(size)
+    factor = 1
+    for candidate in sorted(REDUCED_GRAYSCALE):
+        if long_side / candidate >= min_side:
+            factor = candidate
+    return factor
+
+
+def load_scan(data, template_size=TEMPLATE_SIZE, min_scale=MIN_WORKING_SCALE):
+    """
+    Decode an uploaded photo straight to a grayscale image at working resolution.
+
+    JPEGs are downscaled by libjpeg while decoding (no full-size colour buffer is ever
+    allocated) and OpenCV applies the EXIF orientation, so the result is upright as the
+    phone showed it. Other formats are decoded then reduced by OpenCV.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    factor = reduction_factor(image_size(data), template_size, min_scale)
+    gray = cv2.imdecode(buffer, REDUCED_GRAYSCALE[factor])
+    if gray is None:
+        raise ValueError("Could not decode image")
+    return gray
@@ -0,0 +1,118 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+
+from grading.batch import (
+    load_grading_setup,
+    default_class_code,
+    answer_key_indices,
+    iter_grade,
+    scan_index,
+    save_grade
+)
+from grading.models import GradingJob, GradingJobScan
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn kích thước document BSON của MongoDB (16 MB), chừa chỗ cho các field khác
+MAX_SCAN_BYTES = 15 * 1024 * 1024
+# Số scan lấy về mỗi lần từ MongoDB khi chấm, để worker không giữ cả lô trong RAM
+SCAN_BATCH_SIZE = 8
+
+
+def create_job(exam, teacher_id, scans, class_code=None):
+    """Store uploaded scans in MongoDB with a queued grading job, for a worker on any host"""
+    for name, data in scans:
+        if len(data) > MAX_SCAN_BYTES:
+            raise ValueError(f"Scan {name} is too large to queue ({len(data)} > {MAX_SCAN_BYTES} bytes)")
+
+    job_id = ObjectId()
+    try:
+        GradingJobScan.objects.insert([
+            GradingJobScan(job_id=job_id, position=i, filename=os.path.basename(name), data=data)
+            for i, (name, data) in enumerate(scans)
+        ], load_bulk=False)
+        job = GradingJob(
+            id=job_id,
+            exam_id=str(exam.id),
+            teacher_id=teacher_id,
+            class_code=class_code,
+            status='queued',
+            total=len(scans)
+        )
+        job.save()
+    except Exception:
+        GradingJobScan.objects(job_id=job_id).delete()
+        raise
+    logger.info(f"Queued grading job {job.id} with {len(scans)} scans for exam {exam.id}")
+    return job
+
+
+def claim_next_job(worker):
+    """Atomically take the oldest queued job, None if the queue is empty"""
+    now = datetime.now()
+    return GradingJob.objects(status='queued').order_by('created_at').modify(
+        new=True,
+        set__status='running',
+        set__worker=worker,
+        set__started_at=now,
+        set__heartbeat_at=now
+    )
+
+
+def requeue_stale_jobs(stale_seconds=None):
+    """Put back jobs whose worker stopped sending heartbeats (crashed or killed)"""
+    stale_seconds = stale_seconds or settings.GRADING_CONFIG['JOB_STALE_SECONDS']
+    cutoff = datetime.now() - timedelta(seconds=stale_seconds)
+    count = GradingJob.objects(status='running', heartbeat_at__lt=cutoff).update(
+        set__status='queued',
+        set__processed=0,
+        set__success_count=0,
+        set__error_count=0,
+        set__errors=[],
+        unset__worker=True
+    )
+    if count:
+        logger.warning(f"Requeued {count} stale grading jobs")
+    return count
+
+
+def _read_job_scans(job):
+    scans = GradingJobScan.objects(job_id=job.id).order_by('position').only('filename', 'data')
+    for scan in scans.batch_size(SCAN_BATCH_SIZE):
+        yield scan.filename, scan.data
+
+
+def run_job(job):
+    """Grade every scan of a claimed job, writing Grade rows and progress as each sheet finishes"""
+    try:
+        exam, template, answer_key = load_grading_setup(job.exam_id, job.teacher_id)
+        class_code = default_class_code(exam, job.class_code)
+        answer_keys = answer_key_indices(answer_key)
+
+        index = scan_index(exam, template, answer_keys)
+        for result in iter_grade(_read_job_scans(job), template, answer_keys, index=index):
+            if 'error' not in result:
+                try:
+                    save_grade(exam, result, class_code)
+                except Exception as e:
+                    result['error'] = str(e)
+
+            update = {'inc__processed': 1, 'set__heartbeat_at': datetime.now()}
+            if 'error' in result:
+                update['inc__error_count'] = 1
+                update['push__errors'] = {'filename': result['filename'], 'error': result['error']}
+            else:
+                update['inc__success_count'] = 1
+            job.update(**update)
+
+        job.update(set__status='done', set__finished_at=datetime.now())
+        logger.info(f"Finished grading job {job.id}")
+    except Exception as e:
+        logger.error(f"Grading job {job.id} failed: {str(e)}")
+        job.update(set__status='failed', set__error=str(e), set__finished_at=datetime.now())
+    finally:
+        GradingJobScan.objects(job_id=job.id).delete()
@@ -0,0 +1,100 @@
+import json
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+
+from grading.scoring import BubbleStencil
+
+# Kích thước ảnh template (A4, 300 DPI) mà toạ độ JSON sử dụng
+TEMPLATE_SIZE = (2481, 3508)
+
+# Số template đã compile giữ trong bộ nhớ mỗi process
+TEMPLATE_CACHE_SIZE = 32
+
+ID_SECTIONS = {
+    'student': 'student_id_section',
+    'quiz': 'quiz_id_section',
+    'class': 'class_id_section'
+}
+
+REGION_NAMES = ['info_section', 'student_id_section', 'quiz_id_section', 'class_id_section', 'answer_area']
+
+
+def qr_search_region(info):
+    """
+    (x, y, w, h) where personalized sheets print their QR code: the square in the
+    bottom-right corner of the info section, below the last field line.
+    """
+    x, y, w, h = info['position']
+    lines = [f['line']['start'][1] for f in info.get('fields', [])]
+    top = max(lines, default=y)
+    side = min(max(y + h - top, 0), w)
+    return x + w - side, top, side, side
+
+
+def _frozen(array, dtype):
+    array = np.array(array, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+class CompiledTemplate:
+    """
+    Immutable geometry of one answer sheet template, compiled once from the JSON metadata
+    written by answer_sheets.utils.generate_answer_sheet.
+
+    Holds NumPy arrays of marker coordinates and the bubble stencils, so grading a sheet
+    does no JSON parsing or Python-level geometry work.
+    """
+
+    def __init__(self, data, size=TEMPLATE_SIZE):
+        self.size = tuple(size)
+        shape = (self.size[1], self.size[0])
+
+        markers = data['aruco_marker']
+        self.marker_ids = _frozen([m['id'] for m in markers], np.int32)
+        self.marker_points = _frozen([m['position'] for m in markers], np.float32)
+        self.marker_sizes = _frozen([m.get('size', 50) for m in markers], np.int32)
+        self.regions = MappingProxyType({name: tuple(data[name]['position']) for name in REGION_NAMES})
+        self.qr_region = qr_search_region(data['info_section'])
+
+        # Vùng trả lời
+        questions = data['answer_area']['questions']
+        self.questions = tuple(questions)
+        self.num_questions = len(questions)
+        self.num_options = max((len(q['bubbles']) for q in questions), default=0)
+        self.answer_stencil = BubbleStencil([q['bubbles'] for q in questions], shape)
+
+        # Vùng mã số (student / quiz / class)
+        self.id_sections = MappingProxyType({label: data[key] for label, key in ID_SECTIONS.items()})
+        self.id_stencils = MappingProxyType({
+            label: BubbleStencil([col['bubbles'] for col in sec['columns']], shape)
+            for label, sec in self.id_sections.items()
+        })
+
+    def match_markers(self, detected):
+        """Pair detected marker centers with their template positions"""
+        found = {}
+        for marker in detected:
+            found.setdefault(marker['id'], marker['position'])
+        input_points, template_points = [], []
+        for marker_id, point in zip(self.marker_ids, self.marker_points):
+            position = found.get(int(marker_id))
+            if position is not None:
+                input_points.append(position)
+                template_points.append(point)
+        return np.array(input_points, dtype=np.float32), np.array(template_points, dtype=np.float32)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def load_compiled_template(json_path, template_id=None, updated_at=None):
+    """
+    Compile a template JSON file, cached per process.
+
+    template_id and updated_at are only part of the cache key, so editing a template
+    (which bumps updated_at) compiles it again instead of serving a stale layout.
+    """
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    return CompiledTemplate(data)
@@ -0,0 +1,32 @@
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from grading.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = ('Run a grading worker that processes queued grading jobs. Scans are stored in MongoDB '
+            'with their job, so workers can run on any host that reaches the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        poll_seconds = settings.GRADING_CONFIG['WORKER_POLL_SECONDS']
+        self.stdout.write(f"Grading worker {worker} started")
+
+        while True:
+            requeue_stale_jobs()
+            job = claim_next_job(worker)
+            if job:
+                self.stdout.write(f"Processing grading job {job.id} ({job.total} scans)")
+                run_job(job)
+                continue
+            if options['once']:
+                break
+            time.sleep(poll_seconds)
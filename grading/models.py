@@ -1,4 +1,7 @@
-from mongoengine import Document, StringField, FloatField, DictField
+from datetime import datetime
+
+from mongoengine import (Document, StringField, FloatField, DictField, IntField, ListField, ObjectIdField, DateTimeField,
+                         LongField, BinaryField)
 
 
 # Create your models here.
@@ -7,4 +10,83 @@ class Grade(Document):
     exam_id = StringField(required=True)
     student_id = StringField(required=True)
     score = FloatField()
-    answers = DictField()
\ No newline at end of file
+    answers = DictField()
+
+    meta = {
+        'indexes': [
+            # save_grade (upsert) và regrade_exam (bulk update) lọc đúng theo hai field này
+            {'fields': ['exam_id', 'student_id'], 'unique': True}
+        ]
+    }
+
+
+class GradingJob(Document):
+    STATUS_CHOICES = ('queued', 'running', 'done', 'failed')
+
+    exam_id = StringField(required=True)
+    teacher_id = ObjectIdField(required=True)
+    class_code = StringField()
+    status = StringField(required=True, choices=STATUS_CHOICES, default='queued')
+    total = IntField(default=0)
+    processed = IntField(default=0)
+    success_count = IntField(default=0)
+    error_count = IntField(default=0)
+    errors = ListField(DictField())
+    # Format: {"filename": "img1.jpg", "error": "..."}
+    worker = StringField()
+    error = StringField()
+    created_at = DateTimeField(default=datetime.now)
+    started_at = DateTimeField()
+    heartbeat_at = DateTimeField()
+    finished_at = DateTimeField()
+
+    meta = {
+        'collection': 'grading_jobs',
+        'indexes': [
+            ('status', 'created_at'),
+            'teacher_id',
+            'exam_id'
+        ]
+    }
+
+
+class GradingJobScan(Document):
+    """
+    One uploaded scan of a grading job. The bytes live in MongoDB with the job, not on the
+    web node's disk, so a worker on any host can grade them.
+    """
+    job_id = ObjectIdField(required=True)
+    position = IntField(required=True)  # thứ tự trong lô upload
+    filename = StringField()
+    data = BinaryField(required=True)
+
+    meta = {
+        'collection': 'grading_job_scans',
+        'indexes': [
+            ('job_id', 'position')
+        ]
+    }
+
+
+class ScanRecord(Document):
+    """
+    One graded scan of an exam, indexed by content so that uploading the same photo
+    again returns this result instead of grading it again (see grading.scan_index).
+    """
+    exam_id = StringField(required=True)
+    sha256 = StringField(required=True)
+    phash = LongField()
+    signature = BinaryField()
+    fill = BinaryField()  # mức tô uint8 của từng bong bóng trả lời, để chấm lại không cần ảnh
+    setup = StringField(required=True)  # hash template + answer key lúc chấm
+    filename = StringField()
+    result = DictField()
+    created_at = DateTimeField(default=datetime.now)
+
+    meta = {
+        'collection': 'scan_records',
+        'indexes': [
+            {'fields': ['exam_id', 'sha256'], 'unique': True},
+            ('exam_id', 'setup')
+        ]
+    }
@@ -0,0 +1,63 @@
+import logging
+
+from pymongo import UpdateOne
+
+from answer_keys.models import AnswerKey
+from answer_sheets.models import AnswerSheetTemplate
+from grading.batch import answer_key_indices, template_key
+from grading.grade_pipeline import rescore_fills
+from grading.layout import load_compiled_template
+from grading.models import Grade, ScanRecord
+from grading.scan_index import grading_setup_hash
+from grading.scoring import CompiledAnswerKey
+
+logger = logging.getLogger(__name__)
+
+
+def regrade_exam(exam):
+    """
+    Score every stored scan of an exam again against its current answer key, from the
+    fill levels kept in ScanRecord, and update the Grade rows. No image is decoded: all
+    sheets are scored in one matrix operation and the writes go out as two bulk
+    operations. The marked answers do not change, only the scores.
+
+    Scans graded before fill levels were stored, or whose version is no longer in the
+    answer key, are skipped. Returns {'regraded': n, 'skipped': n}.
+    """
+    template = AnswerSheetTemplate.objects(id=exam.answersheet).first()
+    answer_key = AnswerKey.objects(quiz_id=str(exam.id)).first()
+    if not template or not template.file_json or not answer_key or not answer_key.versions:
+        return {'regraded': 0, 'skipped': 0}
+
+    answer_keys = answer_key_indices(answer_key)
+    key = template_key(template)
+    compiled = load_compiled_template(*key)
+    setup = grading_setup_hash(key, answer_keys)
+
+    records = list(ScanRecord.objects(exam_id=str(exam.id)).order_by('created_at').only('id', 'fill', 'result'))
+    scores = rescore_fills([record.fill for record in records], compiled, CompiledAnswerKey(answer_keys),
+                           [record.result.get('quiz_id') for record in records])
+
+    record_updates = []
+    grades = {}
+    for record, scored in zip(records, scores):
+        if scored is None:
+            continue
+        record_updates.append(UpdateOne({'_id': record.id}, {'$set': {
+            'setup': setup,
+            **{f'result.{field}': value for field, value in scored.items()}
+        }}))
+        if record.result.get('student_id'):
+            # Nhiều ảnh của cùng một học sinh: ảnh upload sau cùng quyết định điểm, như lúc chấm
+            grades[record.result['student_id']] = scored['score']
+
+    if record_updates:
+        ScanRecord._get_collection().bulk_write(record_updates, ordered=False)
+    if grades:
+        Grade._get_collection().bulk_write([
+            UpdateOne({'exam_id': str(exam.id), 'student_id': student_id}, {'$set': {'score': score}})
+            for student_id, score in grades.items()
+        ], ordered=False)
+    skipped = len(records) - len(record_updates)
+    logger.info(f"Regraded {len(record_updates)} scans of exam {exam.id} ({skipped} skipped)")
+    return {'regraded': len(record_updates), 'skipped': skipped}
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+
+from grading.fingerprint import PHASH_MAX_DISTANCE, hamming, same_scan
+from grading.models import ScanRecord
+
+logger = logging.getLogger(__name__)
+
+# Khoá chỉ có nghĩa cho một lần upload, không lưu vào ScanRecord
+TRANSIENT_KEYS = ('filename', 'profile', 'fingerprint', 'fill', 'grade_id', 'error', 'duplicate_of', 'duplicate')
+
+
+def grading_setup_hash(template_key, answer_keys):
+    """Changes whenever the template or the answer key changes, which invalidates stored results"""
+    canonical = json.dumps([list(template_key), answer_keys], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ScanIndex:
+    """
+    Scans already graded for one exam under the current template and answer key.
+
+    Only hashes are loaded up front (one query per batch). Exact copies are found by
+    SHA-256, re-encoded or resized copies by the fingerprint of a reduced decode, both
+    before grading. The pHash picks candidates and the mark signature confirms them,
+    since sheets of the same layout photographed the same way have nearly equal pHashes
+    whatever was filled in.
+    """
+
+    def __init__(self, exam_id, setup):
+        self.exam_id = str(exam_id)
+        self.setup = setup
+        self._by_sha = {}
+        self._phashes = []
+        self._signatures = {}
+        self._results = {}
+        for record in ScanRecord.objects(exam_id=self.exam_id, setup=setup).only('id', 'sha256', 'phash'):
+            self._by_sha[record.sha256] = record.id
+            if record.phash is not None:
+                self._phashes.append((record.phash, record.id))
+
+    def _load(self, record_id):
+        if record_id not in self._results:
+            record = ScanRecord.objects(id=record_id).only('result', 'filename').first()
+            if not record:
+                return None
+            self._results[record_id] = (record.result, record.filename)
+        return self._results[record_id]
+
+    def find_exact(self, digest):
+        """(result, filename) of a scan with the same bytes, None otherwise"""
+        record_id = self._by_sha.get(digest)
+        return self._load(record_id) if record_id is not None else None
+
+    def find_similar(self, fingerprint):
+        """(result, filename) of a scan showing the same photo, None otherwise"""
+        if not fingerprint:
+            return None
+        candidates = [record_id for phash, record_id in self._phashes
+                      if hamming(phash, fingerprint['phash']) <= PHASH_MAX_DISTANCE]
+        missing = [record_id for record_id in candidates if record_id not in self._signatures]
+        if missing:
+            for record in ScanRecord.objects(id__in=missing).only('id', 'signature'):
+                self._signatures[record.id] = record.signature
+        for record_id in candidates:
+            signature = self._signatures.get(record_id)
+            if signature and same_scan(fingerprint['signature'], signature):
+                return self._load(record_id)
+        return None
+
+    def add(self, digest, fingerprint, result, filename, fill=None):
+        stored = {k: v for k, v in result.items() if k not in TRANSIENT_KEYS}
+        update = {
+            'set__setup': self.setup,
+            'set__filename': filename,
+            'set__result': stored,
+        }
+        if fill is not None:
+            update['set__fill'] = fill
+        if fingerprint:
+            update['set__phash'] = fingerprint['phash']
+            update['set__signature'] = fingerprint['signature']
+        try:
+            record = ScanRecord.objects(exam_id=self.exam_id, sha256=digest).modify(upsert=True, new=True, **update)
+        except Exception as e:
+            # Không lưu được chỉ mất khả năng nhận ra bản trùng, không làm hỏng kết quả chấm
+            logger.error(f"Error recording scan {filename} of exam {self.exam_id}: {str(e)}")
+            return
+        self._by_sha[digest] = record.id
+        self._results[record.id] = (stored, filename)
+        if fingerprint:
+            self._phashes.append((fingerprint['phash'], record.id))
+            self._signatures[record.id] = fingerprint['signature']
@@ -0,0 +1,164 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+
+def bounding_box(bubbles, shape):
+    xs = [b['position'][0] for b in bubbles]
+    ys = [b['position'][1] for b in bubbles]
+    rs = [b['radius'] for b in bubbles]
+    x1 = max(int(min(xs) - max(rs)), 0)
+    x2 = min(int(max(xs) + max(rs)), shape[1])
+    y1 = max(int(min(ys) - max(rs)), 0)
+    y2 = min(int(max(ys) + max(rs)), shape[0])
+    return x1, y1, x2, y2
+
+
+@lru_cache(maxsize=None)
+def disc_offsets(radius):
+    """Offsets (dy, dx) of the pixels cv2.circle fills for a given radius"""
+    patch = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=np.uint8)
+    cv2.circle(patch, (radius, radius), radius, 1, -1)
+    dy, dx = np.nonzero(patch)
+    return dy - radius, dx - radius
+
+
+class BubbleStencil:
+    """
+    Precomputed pixel layout for a set of bubble groups (one group = one question or one ID column).
+
+    Each group keeps its own Otsu threshold over its bounding box, like the per-question
+    threshold_region did, but the marked pixels of every bubble are counted in a single
+    NumPy pass over a flat index of all bubble pixels instead of one mask per bubble.
+
+    The stencil only covers the smallest rectangle containing all its groups: origin and
+    size give that rectangle in template coordinates and count_filled() expects an image
+    of exactly that size, either cropped from a warped page (crop()) or warped directly.
+    """
+
+    def __init__(self, groups, shape):
+        page_boxes = [bounding_box(bubbles, shape) for bubbles in groups]
+        if page_boxes:
+            x0 = min(b[0] for b in page_boxes)
+            y0 = min(b[1] for b in page_boxes)
+            x_end = max(b[2] for b in page_boxes)
+            y_end = max(b[3] for b in page_boxes)
+        else:
+            x0 = y0 = x_end = y_end = 0
+        self.origin = (x0, y0)
+        self.size = (x_end - x0, y_end - y0)
+        self.shape = (y_end - y0, x_end - x0)
+        width = self.size[0]
+        self.boxes = [(x1 - x0, y1 - y0, x2 - x0, y2 - y0) for x1, y1, x2, y2 in page_boxes]
+
+        pix_index = []
+        group_sizes = []
+        areas = []
+        offsets = [0]
+        for bubbles, (x1, y1, x2, y2) in zip(groups, self.boxes):
+            group_size = 0
+            for b in bubbles:
+                cx, cy = int(b['position'][0]) - x0, int(b['position'][1]) - y0
+                dy, dx = disc_offsets(int(b['radius']))
+                py, px = cy + dy, cx + dx
+                # Cắt phần hình tròn nằm ngoài bounding box, giống mask trên ROI cũ
+                inside = (px >= x1) & (px < x2) & (py >= y1) & (py < y2)
+                flat = py[inside] * width + px[inside]
+                pix_index.append(flat)
+                areas.append(flat.size)
+                group_size += flat.size
+            group_sizes.append(group_size)
+            offsets.append(offsets[-1] + len(bubbles))
+
+        self.num_groups = len(group_sizes)
+        self.num_bubbles = len(areas)
+        self.offsets = np.array(offsets)
+        # Nhóm (câu hỏi) và vị trí trong nhóm (phương án) của từng bong bóng
+        self.bubble_group = np.repeat(np.arange(self.num_groups), np.diff(self.offsets))
+        self.bubble_option = np.arange(self.num_bubbles) - self.offsets[self.bubble_group]
+        # Ma trận thuộc nhóm (bong bóng x nhóm): tổng theo câu hỏi = một phép nhân ma trận
+        self.membership = np.zeros((self.num_bubbles, self.num_groups), dtype=np.int32)
+        self.membership[np.arange(self.num_bubbles), self.bubble_group] = 1
+        self.areas = np.array(areas, dtype=np.int64)
+        self._group_sizes = np.array(group_sizes, dtype=np.int64)
+        self._pix_index = np.concatenate(pix_index) if pix_index else np.empty(0, dtype=np.intp)
+        self._bubble_starts = np.cumsum(self.areas) - self.areas
+
+    def crop(self, page):
+        """The part of a full warped page covered by this stencil"""
+        x0, y0 = self.origin
+        w, h = self.size
+        return page[y0:y0 + h, x0:x0 + w]
+
+    def thresholds(self, gray):
+        """Otsu threshold of every group's bounding box"""
+        return np.array([
+            cv2.threshold(gray[y1:y2, x1:x2], 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[0]
+            for x1, y1, x2, y2 in self.boxes
+        ], dtype=np.uint8)
+
+    def count_filled(self, gray):
+        """Number of dark (marked) pixels inside every bubble"""
+        if gray.shape[:2] != self.shape:
+            raise ValueError(f"Image shape {gray.shape[:2]} does not match stencil shape {self.shape}")
+        if self._pix_index.size == 0:
+            return np.zeros(self.num_bubbles, dtype=np.int64)
+        values = gray.reshape(-1)[self._pix_index]
+        filled = values <= np.repeat(self.thresholds(gray), self._group_sizes)
+        starts = np.minimum(self._bubble_starts, filled.size - 1)
+        counts = np.add.reduceat(filled, starts, dtype=np.int64)
+        counts[self.areas == 0] = 0
+        return counts
+
+    def fill_ratios(self, gray):
+        """Fraction of every bubble's area that is marked"""
+        return self.count_filled(gray) / np.maximum(self.areas, 1)
+
+    def split(self, values):
+        """Split a per-bubble array into one array per group"""
+        return np.split(values, self.offsets[1:-1])
+
+
+class CompiledAnswerKey:
+    """
+    Correct option index of every question of every exam version as an int8 matrix
+    (versions x questions), -1 past the end of a shorter version.
+
+    score() grades a whole batch of sheets at once from their marked bubbles: the
+    per-question mark counts and key hits are two matrix products over the stencil's
+    bubble-to-question membership, with no Python loop over sheets or questions.
+    """
+
+    def __init__(self, answer_keys):
+        self.versions = list(answer_keys)
+        self._rows = {version: row for row, version in enumerate(self.versions)}
+        self.lengths = np.array([len(key) for key in answer_keys.values()], dtype=np.int64)
+        self.matrix = np.full((len(self.versions), int(self.lengths.max(initial=0))), -1, dtype=np.int8)
+        for row, key in enumerate(answer_keys.values()):
+            self.matrix[row, :len(key)] = key
+
+    def row(self, version):
+        """Matrix row of a version code (a single-version key matches any code); -1 if unknown"""
+        if version in self._rows:
+            return self._rows[version]
+        return 0 if len(self.versions) == 1 else -1
+
+    def score(self, marked, stencil, rows):
+        """
+        marked: bool matrix (sheets x stencil bubbles); rows: answer key row of every sheet.
+        Returns (correct, total) arrays. A question counts only when exactly its correct
+        option is marked.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        num_questions = min(stencil.num_groups, self.matrix.shape[1])
+        keys = np.full((len(rows), stencil.num_groups), -1, dtype=np.int8)
+        keys[:, :num_questions] = self.matrix[rows, :num_questions]
+        on_key = keys[:, stencil.bubble_group] == stencil.bubble_option
+
+        marks = marked.astype(np.int32) @ stencil.membership
+        hits = (marked & on_key).astype(np.int32) @ stencil.membership
+
+        correct = ((marks == 1) & (hits == 1)).sum(axis=1)
+        total = np.minimum(self.lengths[rows], stencil.num_groups)
+        return correct, total
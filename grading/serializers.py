@@ -7,4 +7,19 @@ class GradeSerializer(serializers.Serializer):
     exam_id = serializers.CharField()
     student_id = serializers.CharField()
     score = serializers.FloatField()
-    answers = serializers.DictField()
\ No newline at end of file
+    answers = serializers.DictField()
+
+class GradingJobSerializer(serializers.Serializer):
+    id = serializers.CharField(read_only=True)
+    exam_id = serializers.CharField(read_only=True)
+    class_code = serializers.CharField(read_only=True, allow_null=True)
+    status = serializers.CharField(read_only=True)
+    total = serializers.IntegerField(read_only=True)
+    processed = serializers.IntegerField(read_only=True)
+    success_count = serializers.IntegerField(read_only=True)
+    error_count = serializers.IntegerField(read_only=True)
+    errors = serializers.ListField(child=serializers.DictField(), read_only=True)
+    error = serializers.CharField(read_only=True, allow_null=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    started_at = serializers.DateTimeField(read_only=True, allow_null=True)
+    finished_at = serializers.DateTimeField(read_only=True, allow_null=True)
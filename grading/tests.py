@@ -1,3 +1,115 @@
-from django.test import TestCase
+import io
+import os
+import threading
+import zipfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from grading import batch
+
+
+def fake_grade_scan(data, template_key, answer_keys, profile=False):
+    """Stand-in for grade_scan run in the pool workers: b'crash' kills its worker"""
+    if data == b'crash':
+        os._exit(1)
+    time.sleep(0.05)
+    return {'score': float(data.decode())}
+
+
+@mock.patch('grading.batch.grade_scan', fake_grade_scan)
+@mock.patch('grading.batch.template_key', lambda template: None)
+class IterGradeWorkerCrashTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(settings.GRADING_CONFIG, {'MAX_WORKERS': 2})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        batch._executor = None
+        self.addCleanup(self.shutdown_pool)
+
+    def shutdown_pool(self):
+        if batch._executor is not None:
+            batch._executor.shutdown(wait=True)
+            batch._executor = None
+
+    def test_batch_finishes_when_workers_are_killed(self):
+        scans = [(f'{i}.jpg', str(i).encode()) for i in range(12)]
+        results = []
+        for result in batch.iter_grade(scans, None, {}):
+            if not results:
+                for process in list(batch._executor._processes.values()):
+                    process.kill()
+            results.append(result)
+
+        self.assertEqual([r['filename'] for r in results], [name for name, _ in scans])
+        self.assertEqual([r.get('error') for r in results], [None] * len(scans))
+        self.assertEqual([r['score'] for r in results], [float(i) for i in range(12)])
+
+    def test_crashing_scan_fails_alone(self):
+        scans = [(f'{i}.jpg', str(i).encode()) for i in range(4)]
+        scans.append(('crash.jpg', b'crash'))
+        scans += [(f'{i}.jpg', str(i).encode()) for i in range(4, 12)]
+        results = list(batch.iter_grade(scans, None, {}))
+
+        self.assertEqual([r['filename'] for r in results], [name for name, _ in scans])
+        self.assertIn('error', results[4])
+        # Các scan gửi sau khi pool được thay lần cuối vẫn được chấm
+        self.assertEqual(results[-1]['score'], 11.0)
+
+    def test_concurrent_batches_share_a_replaced_pool(self):
+        scans = [(f'{i}.jpg', str(i).encode()) for i in range(8)]
+        results = {}
+
+        def grade(label):
+            results[label] = list(batch.iter_grade(scans, None, {}))
+
+        threads = [threading.Thread(target=grade, args=(label,)) for label in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        for process in list(batch.get_executor()._processes.values()):
+            process.kill()
+        for thread in threads:
+            thread.join()
+
+        for label in ('a', 'b'):
+            self.assertEqual([r.get('error') for r in results[label]], [None] * len(scans))
+
+
+class ReadScansLimitTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(settings.GRADING_CONFIG, {
+            'MAX_BATCH_FILES': 3, 'MAX_SCAN_BYTES': 1000, 'MAX_BATCH_BYTES': 2500
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload_zip(self, entries):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in entries:
+                archive.writestr(name, data)
+        return SimpleUploadedFile('scans.zip', buffer.getvalue())
+
+    def test_zip_within_limits(self):
+        scans = batch.read_scans([self.upload_zip([('a.jpg', b'a' * 1000), ('notes.txt', b'x'), ('b.png', b'b')])])
+        self.assertEqual(scans, [('a.jpg', b'a' * 1000), ('b.png', b'b')])
+
+    def test_zip_limits_checked_before_decompressing(self):
+        bomb = self.upload_zip([('bomb.jpg', b'\0' * 10 ** 7)])
+        with mock.patch.object(zipfile.ZipFile, 'open') as open_entry:
+            with self.assertRaisesMessage(ValueError, 'too large'):
+                batch.read_scans([bomb])
+        open_entry.assert_not_called()
+
+        many = self.upload_zip([(f'{i}.jpg', b'x') for i in range(4)])
+        with self.assertRaisesMessage(ValueError, 'Too many scans'):
+            batch.read_scans([many])
+
+        total = self.upload_zip([(f'{i}.jpg', b'x' * 900) for i in range(3)])
+        with self.assertRaisesMessage(ValueError, 'Batch is too large'):
+            batch.read_scans([total])
 
-# Create your tests here.
@@ -1,8 +1,11 @@
 from django.urls import path
 
-from grading.views import GradeListView, GradeDetailView
+from grading.views import GradeListView, GradeDetailView, GradeBatchView, GradingJobCreateView, GradingJobDetailView
 
 urlpatterns = [
     path('', GradeListView.as_view(), name='grade-list-create'),
+    path('batch/', GradeBatchView.as_view(), name='grade-batch'),
+    path('jobs/', GradingJobCreateView.as_view(), name='grading-job-create'),
+    path('jobs/<str:id>/', GradingJobDetailView.as_view(), name='grading-job-detail'),
     path('<str:id>/', GradeDetailView.as_view(), name='grade-detail' ),
 ]
\ No newline at end of file
@@ -1,23 +1,56 @@
 # Create your views here.
+import logging
+import time
+import traceback
+
+from bson import ObjectId
+from mongoengine import NotUniqueError
+
 from rest_framework import status
+from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from grading.models import Grade
-from grading.serializers import GradeSerializer
+from grading.batch import (
+    GradingSetupError,
+    load_grading_setup,
+    default_class_code,
+    read_scans,
+    answer_key_indices,
+    grade_batch,
+    scan_index,
+    save_grade
+)
+from grading.jobs import create_job
+from grading.models import Grade, GradingJob
+from grading.profiling import log_profile, merge_profiles
+from grading.serializers import GradeSerializer, GradingJobSerializer
+from bubblesheet_backend.pagination import list_response
+
+logger = logging.getLogger(__name__)
+
+
+def profiling_requested(request):
+    """?profile=1 (or a profile form field) turns on per-stage profiling for one request"""
+    value = request.query_params.get('profile') or request.data.get('profile')
+    return str(value).lower() in ('1', 'true', 'yes')
 
 
 class GradeListView(APIView):
     def get(self, request):
         gradebooks = Grade.objects.all()
-        serializer = GradeSerializer(gradebooks, many=True)
-        return Response(serializer.data)
+        return list_response(request, gradebooks, lambda docs: GradeSerializer(docs, many=True).data,
+                             {name: name for name in GradeSerializer._declared_fields})
 
     def post(self, request):
         serializer = GradeSerializer(data=request.data)
         if serializer.is_valid():
             grade_obj = Grade(**serializer.validated_data)
-            grade_obj.save()
+            try:
+                grade_obj.save()
+            except NotUniqueError:
+                return Response({'error': 'Grade already exists for this student and exam'}, status=400)
             return Response(GradeSerializer(grade_obj).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -40,7 +73,10 @@ class GradeDetailView(APIView):
         if serializer.is_valid():
             for attr, value in serializer.validated_data.items():
                 setattr(grade_obj, attr, value)
-            grade_obj.save()
+            try:
+                grade_obj.save()
+            except NotUniqueError:
+                return Response({'error': 'Grade already exists for this student and exam'}, status=400)
             return Response(GradeSerializer(grade_obj).data)
         return Response(serializer.errors, status=400)
 
@@ -50,3 +86,99 @@ class GradeDetailView(APIView):
             return Response({'error': 'Not found'}, status=404)
         grade_obj.delete()
         return Response(status=204)
+
+
+class GradeBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        try:
+            try:
+                exam, template, answer_key = load_grading_setup(request.data.get('exam_id'), request.user.id)
+            except GradingSetupError as e:
+                return Response({'error': str(e)}, status=e.status_code)
+
+            try:
+                scans = read_scans(request.FILES.getlist('files'))
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if not scans:
+                return Response({'error': 'No images uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+
+            default_class = default_class_code(exam, request.data.get('class_code'))
+            profile = profiling_requested(request)
+
+            answer_keys = answer_key_indices(answer_key)
+            start = time.perf_counter()
+            results = grade_batch(scans, template, answer_keys, profile, scan_index(exam, template, answer_keys))
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+            for result in results:
+                if 'error' in result:
+                    continue
+                try:
+                    result['grade_id'] = save_grade(exam, result, default_class)
+                except Exception as e:
+                    result['error'] = str(e)
+
+            error_count = sum(1 for r in results if 'error' in r)
+            duplicate_count = sum(1 for r in results if r.get('duplicate_of'))
+            logger.info(f"Graded {len(results)} scans for exam {exam.id}, {error_count} errors, "
+                        f"{duplicate_count} duplicates")
+            data = {
+                'exam_id': str(exam.id),
+                'success_count': len(results) - error_count,
+                'error_count': error_count,
+                'duplicate_count': duplicate_count,
+                'results': results
+            }
+            if profile:
+                for result in results:
+                    if result.get('profile'):
+                        log_profile(logger, result['profile'], exam_id=str(exam.id), filename=result['filename'])
+                data['profile'] = {'wall_ms': elapsed_ms, **merge_profiles(r.get('profile') for r in results)}
+                log_profile(logger, data['profile'], exam_id=str(exam.id), batch=True)
+            return Response(data)
+        except Exception as e:
+            logger.error(f"Error grading batch: {str(e)}\n{traceback.format_exc()}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class GradingJobCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        try:
+            try:
+                exam, _, _ = load_grading_setup(request.data.get('exam_id'), request.user.id)
+            except GradingSetupError as e:
+                return Response({'error': str(e)}, status=e.status_code)
+
+            try:
+                scans = read_scans(request.FILES.getlist('files'))
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if not scans:
+                return Response({'error': 'No images uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                job = create_job(exam, request.user.id, scans, request.data.get('class_code'))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(GradingJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            logger.error(f"Error creating grading job: {str(e)}\n{traceback.format_exc()}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class GradingJobDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, id):
+        if not ObjectId.is_valid(id):
+            return Response({'error': 'Not found'}, status=404)
+        job = GradingJob.objects(id=id, teacher_id=request.user.id).first()
+        if not job:
+            return Response({'error': 'Not found'}, status=404)
+        return Response(GradingJobSerializer(job).data)
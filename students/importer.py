@@ -0,0 +1,199 @@
+import logging
+import random
+import re
+
+from bson import ObjectId
+from mongoengine import ValidationError
+from pymongo.errors import BulkWriteError
+
+from classes.models import Class
+from students.models import Student
+
+logger = logging.getLogger(__name__)
+
+STUDENT_ID_PATTERN = re.compile(r'^[A-Za-z0-9]+$')
+DUPLICATE_KEY_ERROR = 11000
+
+
+class ImportRow:
+    """One roster row: where it came from (for error reports) and the student it describes"""
+
+    def __init__(self, row, data, student_id, first_name, last_name, class_ref=None):
+        self.row = row
+        self.data = data
+        self.student_id = student_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.class_ref = class_ref  # id của class (JSON) hoặc tên class (CSV)
+        self.error = None
+        self.class_id = None
+        self.student = None
+
+
+def json_rows(students, class_id=None):
+    """Rows of the JSON import: every student goes to the class_id chosen in the app"""
+    rows = []
+    for idx, s in enumerate(students, start=1):
+        if not isinstance(s, dict):
+            rows.append(ImportRow(idx, s, '', '', ''))
+            rows[-1].error = 'Invalid student row'
+            continue
+        rows.append(ImportRow(
+            idx, s,
+            str(s.get('student_id', '')).strip(),
+            str(s.get('first_name', '')).strip(),
+            str(s.get('last_name', '')).strip(),
+            class_id
+        ))
+        if not rows[-1].student_id or not rows[-1].first_name or not rows[-1].last_name:
+            rows[-1].error = 'Student ID, First Name, Last Name are required'
+    return rows
+
+
+def csv_rows(reader):
+    """Rows of the CSV import: first_name, last_name, student_id, external_ref, class_name"""
+    rows = []
+    for idx, row in enumerate(reader, start=1):
+        cell = lambda i: row[i].strip() if len(row) > i else ''
+        rows.append(ImportRow(idx, row, cell(2), cell(0), cell(1), cell(4) or None))
+        if not rows[-1].first_name or not rows[-1].last_name:
+            rows[-1].error = 'First name and last name are required'
+    return rows
+
+
+def _resolve_class_ids(rows, teacher_id):
+    """Class of the JSON import, checked once instead of once per student"""
+    refs = {row.class_ref for row in rows if row.class_ref and not row.error}
+    owned = {}
+    valid_refs = [ref for ref in refs if ObjectId.is_valid(str(ref))]
+    if valid_refs:
+        owned = {str(c.id): c.id for c in Class.objects(id__in=valid_refs, teacher_id=teacher_id).only('id')}
+    for row in rows:
+        if row.class_ref and not row.error:
+            row.class_id = owned.get(str(row.class_ref))
+            if row.class_id is None:
+                row.error = f"Class with code {row.class_ref} not found or is not owned by teacher"
+
+
+def _resolve_class_names(rows, teacher_id):
+    """Classes of the CSV import by name; the missing ones are created, once each"""
+    names = {row.class_ref for row in rows if row.class_ref and not row.error}
+    if not names:
+        return
+    classes = {c.class_name: c.id for c in Class.objects(class_name__in=list(names), teacher_id=teacher_id).only('id', 'class_name')}
+    failed = {}
+    for name in names - set(classes):
+        try:
+            class_obj = Class(class_code=name.lower().replace(' ', ''), class_name=name, teacher_id=teacher_id)
+            class_obj.save()
+            classes[name] = class_obj.id
+        except Exception as e:
+            failed[name] = str(e)
+    for row in rows:
+        if row.class_ref and not row.error:
+            if row.class_ref in failed:
+                row.error = failed[row.class_ref]
+            else:
+                row.class_id = classes[row.class_ref]
+
+
+def _generate_student_ids(rows):
+    """Random 6-digit IDs for rows without one, unique within the roster and the database"""
+    pending = [row for row in rows if not row.student_id and not row.error]
+    taken = {row.student_id for row in rows if row.student_id}
+    while pending:
+        for row in pending:
+            candidate = str(random.randint(100000, 999999))
+            while candidate in taken:
+                candidate = str(random.randint(100000, 999999))
+            row.student_id = candidate
+            taken.add(candidate)
+        generated = [row.student_id for row in pending]
+        existing = set(Student.objects(student_id__in=generated).scalar('student_id'))
+        pending = [row for row in pending if row.student_id in existing]
+
+
+def _validate(rows, teacher_id):
+    """Duplicate and field checks in memory, against the student IDs prefetched in one $in query"""
+    ids = [row.student_id for row in rows if not row.error]
+    existing = set(Student.objects(student_id__in=ids).scalar('student_id')) if ids else set()
+    seen = set()
+    for row in rows:
+        if row.error:
+            continue
+        if not STUDENT_ID_PATTERN.match(row.student_id):
+            row.error = 'Student ID must contain only alphanumeric characters'
+            continue
+        if row.student_id in existing or row.student_id in seen:
+            row.error = 'Student ID already exists'
+            continue
+        student = Student(
+            id=ObjectId(),
+            student_id=row.student_id,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            teacher_id=teacher_id,
+            class_codes=[row.class_id] if row.class_id else []
+        )
+        try:
+            # Chỉ kiểm tra field; clean() truy vấn User/Class cho từng học sinh, đã kiểm tra ở trên
+            student.validate(clean=False)
+        except ValidationError as e:
+            row.error = str(e)
+            continue
+        seen.add(row.student_id)
+        row.student = student
+
+
+def _insert(rows):
+    """One unordered insert_many; rows the database rejects get their error instead"""
+    pending = [row for row in rows if row.student]
+    if not pending:
+        return
+    try:
+        Student._get_collection().insert_many([row.student.to_mongo() for row in pending], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get('writeErrors', []):
+            row = pending[error['index']]
+            row.error = 'Student ID already exists' if error.get('code') == DUPLICATE_KEY_ERROR else error.get('errmsg')
+            row.student = None
+
+
+def _add_to_classes(rows):
+    """One $addToSet/$each per class. The students are new, so the count grows by exactly their number"""
+    members = {}
+    for row in rows:
+        if row.student and row.class_id:
+            members.setdefault(row.class_id, []).append(row.student.id)
+    for class_id, student_ids in members.items():
+        try:
+            Class.objects(id=class_id).update_one(add_to_set__student_ids=student_ids,
+                                                  inc__student_count=len(student_ids))
+        except Exception as e:
+            logger.error(f"Error adding {len(student_ids)} imported students to class {class_id}: {str(e)}")
+
+
+def import_students(rows, teacher_id, class_names=False):
+    """
+    Create the students of a roster in bulk.
+
+    class_names tells whether rows refer to their class by name (CSV, created if missing)
+    or by id (JSON). Returns the success/error counts and one error per rejected row.
+    """
+    if class_names:
+        _resolve_class_names(rows, teacher_id)
+    else:
+        _resolve_class_ids(rows, teacher_id)
+    _generate_student_ids(rows)
+    _validate(rows, teacher_id)
+    _insert(rows)
+    _add_to_classes(rows)
+
+    errors = [{'row': row.row, 'error': row.error, 'data': row.data} for row in rows if row.error]
+    success_count = sum(1 for row in rows if row.student)
+    logger.info(f"Imported {success_count} students for teacher {teacher_id}, {len(errors)} rows rejected")
+    return {
+        'success_count': success_count,
+        'error_count': len(errors),
+        'errors': errors
+    }
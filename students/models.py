@@ -17,7 +17,13 @@ class Student(Document):
 
     meta = {
         'collection': 'students',
-        'indexes': ['student_id', 'teacher_id']
+        'indexes': [
+            'student_id',
+            'teacher_id',
+            ('teacher_id', 'id'),
+            ('teacher_id', 'student_id'),
+            ('teacher_id', 'last_name'),
+        ]
     }
 
     def clean(self):
@@ -1,38 +1,54 @@
 from bson import ObjectId
+from mongoengine.queryset.visitor import Q
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import APIException
 import logging
 from rest_framework.parsers import MultiPartParser, FormParser
 import csv
 from io import TextIOWrapper
-import io
-from django.http import HttpResponse
+import tempfile
+from django.http import FileResponse, StreamingHttpResponse
 import openpyxl
 from openpyxl.utils import get_column_letter
 
 from classes.models import Class
+from students.importer import csv_rows, import_students, json_rows
 from students.models import Student
 from students.serializers import StudentSerializer
+from bubblesheet_backend.pagination import list_response
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Khoá trả về -> field của Student, cho ?fields=
+STUDENT_LIST_FIELDS = {
+    '_id': 'id',
+    'student_id': 'student_id',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'teacher_id': 'teacher_id',
+    'class_codes': 'class_codes',
+}
+
 # Create your views here.
 class StudentListCreateView(APIView):
     permission_students = [IsAuthenticated]
 
     def get(self, request):
         try:
-            # Log tất cả student trong database
-            all_students = Student.objects.all()
-            logger.info(f"All students in database: {[s.student_id for s in all_students]}")
-            
-            # Lấy danh sách student của teacher
+            # Một truy vấn theo teacher_id, dùng chỉ mục (teacher_id, ...)
             students = Student.objects.filter(teacher_id=request.user.id)
-            serializer = StudentSerializer(students, many=True)
-            return Response(serializer.data)
+            search = request.query_params.get('search', '').strip()
+            if search:
+                # Tìm theo tiền tố (phân biệt hoa thường) để Mongo quét được chỉ mục
+                students = students.filter(Q(student_id__startswith=search) | Q(last_name__startswith=search))
+            return list_response(request, students, lambda docs: StudentSerializer(docs, many=True).data,
+                                 STUDENT_LIST_FIELDS)
+        except APIException:
+            raise
         except Exception as e:
             logger.error(f"Error getting students: {str(e)}")
             return Response(
@@ -317,154 +333,68 @@ class StudentImportView(APIView):
                 students = json.loads(students_json)
             except Exception as e:
                 return Response({'error': f'Invalid students data: {str(e)}'}, status=400)
-            success_count = 0
-            error_count = 0
-            error_rows = []
-            from students.models import Student
-            from classes.models import Class
-            for idx, s in enumerate(students, start=1):
-                try:
-                    student_id = s.get('student_id', '').strip()
-                    first_name = s.get('first_name', '').strip()
-                    last_name = s.get('last_name', '').strip()
-                    if not student_id or not first_name or not last_name:
-                        raise Exception('Student ID, First Name, Last Name are required')
-                    # Kiểm tra trùng student_id
-                    if Student.objects(student_id=student_id).first():
-                        raise Exception('Student ID already exists')
-                    student = Student(
-                        student_id=student_id,
-                        first_name=first_name,
-                        last_name=last_name,
-                        teacher_id=request.user.id,
-                        class_codes=[class_id] if class_id else []
-                    )
-                    student.save()
-                    # Thêm vào class nếu có
-                    if class_id:
-                        class_obj = Class.objects(id=class_id, teacher_id=request.user.id).first()
-                        if class_obj and student.id not in class_obj.student_ids:
-                            class_obj.student_ids.append(student.id)
-                            class_obj.student_count = len(class_obj.student_ids)
-                            class_obj.save()
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    error_rows.append({'row': idx, 'error': str(e), 'data': s})
-            return Response({
-                'success_count': success_count,
-                'error_count': error_count,
-                'errors': error_rows
-            })
+            if not isinstance(students, list):
+                return Response({'error': 'Invalid students data: expected a list of students'}, status=400)
+            return Response(import_students(json_rows(students, class_id), request.user.id))
         # Nếu không có students, fallback về logic cũ nhận file
         file = request.FILES.get('file')
         has_header = request.data.get('has_header', 'false').lower() == 'true'
         if not file:
             return Response({'error': 'No file uploaded'}, status=400)
-        results = []
-        success_count = 0
-        error_count = 0
-        error_rows = []
         try:
             csvfile = TextIOWrapper(file, encoding='utf-8')
             reader = csv.reader(csvfile)
             if has_header:
                 next(reader, None)
-            for idx, row in enumerate(reader, start=1):
-                try:
-                    # Giả định thứ tự: first_name, last_name, student_id, external_ref, class_name
-                    first_name = row[0].strip() if len(row) > 0 else ''
-                    last_name = row[1].strip() if len(row) > 1 else ''
-                    student_id = row[2].strip() if len(row) > 2 else ''
-                    external_ref = row[3].strip() if len(row) > 3 else ''
-                    class_name = row[4].strip() if len(row) > 4 else ''
-                    if not first_name or not last_name:
-                        raise Exception('First name and last name are required')
-                    # Tìm hoặc tạo class nếu có class_name
-                    class_obj = None
-                    if class_name:
-                        from classes.models import Class
-                        class_obj = Class.objects(class_name=class_name, teacher_id=request.user.id).first()
-                        if not class_obj:
-                            class_obj = Class(class_code=class_name.lower().replace(' ', ''), class_name=class_name, teacher_id=request.user.id)
-                            class_obj.save()
-                    # Nếu không có student_id thì tự sinh
-                    if not student_id:
-                        import random
-                        student_id = str(random.randint(100000, 999999))
-                    # Tạo student
-                    from students.models import Student
-                    student = Student.objects(student_id=student_id).first()
-                    if student:
-                        raise Exception('Student ID already exists')
-                    student = Student(
-                        student_id=student_id,
-                        first_name=first_name,
-                        last_name=last_name,
-                        teacher_id=request.user.id,
-                        class_codes=[class_obj.id] if class_obj else []
-                    )
-                    student.save()
-                    # Thêm student vào class nếu có
-                    if class_obj:
-                        if student.id not in class_obj.student_ids:
-                            class_obj.student_ids.append(student.id)
-                            class_obj.student_count = len(class_obj.student_ids)
-                            class_obj.save()
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    error_rows.append({'row': idx, 'error': str(e), 'data': row})
-            return Response({
-                'success_count': success_count,
-                'error_count': error_count,
-                'errors': error_rows
-            })
+            return Response(import_students(csv_rows(reader), request.user.id, class_names=True))
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
+EXPORT_HEADER = ['Student ID', 'First Name', 'Last Name', 'Class']
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, so csv.writer can feed a stream"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(teacher_id):
+    """Header then one row per student of the teacher; class names come from a single query"""
+    class_names = {c.id: c.class_name for c in Class.objects(teacher_id=teacher_id).only('id', 'class_name')}
+    students = Student.objects(teacher_id=teacher_id).only(
+        'student_id', 'first_name', 'last_name', 'class_codes').no_cache()
+    yield EXPORT_HEADER
+    for s in students:
+        names = [class_names[cid] for cid in s.class_codes if cid in class_names]
+        yield [s.student_id, s.first_name, s.last_name, ', '.join(names)]
+
+
 class StudentExportCSVView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        students = Student.objects.filter(teacher_id=request.user.id)
-        from classes.models import Class
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        writer = csv.writer(_Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in export_rows(request.user.id)),
+            content_type='text/csv; charset=utf-8'
+        )
         response['Content-Disposition'] = 'attachment; filename=students.csv'
-        writer = csv.writer(response)
-        writer.writerow(['Student ID', 'First Name', 'Last Name', 'Class'])
-        for s in students:
-            class_names = []
-            for cid in s.class_codes:
-                class_obj = Class.objects(id=cid).first()
-                if class_obj:
-                    class_names.append(class_obj.class_name)
-            writer.writerow([
-                s.student_id, s.first_name, s.last_name, ', '.join(class_names)
-            ])
         return response
 
 class StudentExportExcelView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        students = Student.objects.filter(teacher_id=request.user.id)
-        from classes.models import Class
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.append(['Student ID', 'First Name', 'Last Name', 'Class'])
-        for s in students:
-            class_names = []
-            for cid in s.class_codes:
-                class_obj = Class.objects(id=cid).first()
-                if class_obj:
-                    class_names.append(class_obj.class_name)
-            ws.append([
-                s.student_id, s.first_name, s.last_name, ', '.join(class_names)
-            ])
-        output = io.BytesIO()
+        # write_only: openpyxl ghi thẳng từng dòng, không giữ cell trong bộ nhớ
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        for row in export_rows(request.user.id):
+            ws.append(row)
+        # File tạm trên đĩa thay vì BytesIO; FileResponse đóng (và xoá) file khi gửi xong
+        output = tempfile.TemporaryFile()
         wb.save(output)
         output.seek(0)
-        response = HttpResponse(output, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=students.xlsx'
-        return response
+        return FileResponse(output, as_attachment=True, filename='students.xlsx', content_type=XLSX_CONTENT_TYPE)